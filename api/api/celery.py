@@ -3,7 +3,7 @@ import pprint
 
 import django.utils.log
 from celery import Celery
-from celery.signals import task_failure
+from celery.signals import task_failure, worker_process_shutdown
 
 app = Celery("api", include="desecapi.mail_backends")
 app.config_from_object("django.conf:settings", namespace="CELERY")
@@ -49,6 +49,13 @@ def task_failure(task_id, exception, args, kwargs, traceback, einfo, **other_kwa
     )
 
 
+@worker_process_shutdown.connect()
+def worker_process_shutdown(**kwargs):
+    from desecapi.mail_backends import MultiLaneEmailBackend
+
+    MultiLaneEmailBackend.close_connections()
+
+
 django.setup()
 logger = logging.getLogger(__name__)
 handler = django.utils.log.AdminEmailHandler()
@@ -47,6 +47,7 @@ MIDDLEWARE = (
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
+    "desecapi.middleware.QueryMetricsMiddleware",
     "django_prometheus.middleware.PrometheusAfterMiddleware",
 )
 
@@ -118,6 +119,12 @@ REST_FRAMEWORK = {
             "100/h",
             "300/d",
         ],  # DNS API requests affecting RRset(s) of a single domain
+        "dns_api_multi_domain_expensive": [
+            "2/s",
+            "15/min",
+            "100/h",
+            "300/d",
+        ],  # DNS API requests affecting RRsets of several domains (per user)
         # UserRateThrottle
         "user": "2000/d",  # hard limit on requests by a) an authenticated user, b) an unauthenticated IP address
     },
@@ -192,6 +199,23 @@ TASK_CONFIG = {  # The first entry is the default queue
 
 # pdns accepts request payloads of this size.
 PDNS_MAX_BODY_SIZE = 32 * 1024 * 1024
+# number of zones whose changes are sent to pdns concurrently
+PDNS_CHANGE_TRACKER_WORKERS = 8
+# retries of idempotent requests after connection errors or 502/503/504
+PDNS_RETRIES = 2
+PDNS_RETRY_BACKOFF = 0.2  # seconds; maximum (jittered) delay doubles with each retry
+# seconds of retry backoff per change tracker in total, as it holds database locks while waiting
+PDNS_CHANGE_TRACKER_RETRY_BUDGET = 2
+# consecutive failures after which requests to a server fail fast
+PDNS_CIRCUIT_BREAKER_THRESHOLD = 5
+# seconds until requests to a server are let through again
+PDNS_CIRCUIT_BREAKER_TIMEOUT = 10
+
+# Per-view database query metrics
+# fraction of requests for which queries are counted and timed
+QUERY_METRICS_SAMPLE_RATE = 0.1
+# seconds; sampled requests taking longer are logged with their queries
+QUERY_METRICS_SLOW_REQUEST = None
 
 # SEPA direct debit settings
 SEPA = {
@@ -220,6 +244,7 @@ REGISTER_LPS = bool(int(os.environ.get("DESECSTACK_API_REGISTER_LPS", "1")))
 
 # CAPTCHA
 CAPTCHA_VALIDITY_PERIOD = timedelta(hours=24)
+CAPTCHA_POOL_SIZE = {"image": 100, "audio": 20}  # pre-rendered challenges per kind
 
 # Watchdog
 WATCHDOG_SECONDARIES = os.environ.get("DESECSTACK_WATCHDOG_SECONDARIES", "").split()
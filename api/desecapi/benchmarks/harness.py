@@ -0,0 +1,166 @@
+import base64
+import statistics
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from desecapi import pdns
+from desecapi.benchmarks.pdns_standin import PDNSStandIn
+from desecapi.benchmarks.scenarios import SCENARIOS, rrsets_data
+from desecapi.models import Token, User
+from desecapi.models.domains import psl
+
+
+class Benchmark:
+    """
+    Runs scenarios against the API in-process, with pdns requests going to a PDNSStandIn. Needs a (test) database;
+    the data created is not cleaned up. Public suffixes are taken to be TLDs, and PCH is disabled.
+    """
+
+    client_class = APIClient
+
+    def __init__(self, repeat=10, warmup=1):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.domain_count = 0
+
+    def __enter__(self):
+        self.stack = ExitStack()
+        self.standin = self.stack.enter_context(PDNSStandIn())
+        for server, name in ((pdns.NSLORD, "nslord"), (pdns.NSMASTER, "nsmaster")):
+            self.stack.enter_context(
+                mock.patch.dict(pdns._config[server], base_url=self.standin.url(name))
+            )
+        self.stack.enter_context(
+            mock.patch.object(pdns, "gethostbyname_cached", return_value="127.0.0.1")
+        )
+        self.stack.enter_context(
+            mock.patch.object(
+                psl, "get_public_suffix", side_effect=lambda name: name.split(".")[-1]
+            )
+        )
+        self.stack.enter_context(
+            mock.patch.object(
+                psl, "is_public_suffix", side_effect=lambda name: "." not in name
+            )
+        )
+        self.stack.enter_context(override_settings(PCH_API=""))
+
+        self.user = User.objects.create_user(
+            email=f"benchmark-{time.time_ns()}@desec.example",
+            password=None,
+            limit_domains=None,
+        )
+        self.token = Token.objects.create(
+            owner=self.user,
+            name="benchmark",
+            perm_create_domain=True,
+            perm_delete_domain=True,
+        )
+        self.client = self.client_class()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.plain}")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stack.close()
+
+    def basic_auth(self, username):
+        credentials = f"{username}:{self.token.plain}".encode()
+        return "Basic " + base64.b64encode(credentials).decode()
+
+    def domain_name(self, prefix, i):
+        return f"{prefix}-{i}-{self.token.pk.hex[:8]}.example"
+
+    def create_domain(self, rrsets=0):
+        self.domain_count += 1
+        name = self.domain_name("bench", self.domain_count)
+        response = self.client.post(reverse("v1:domain-list"), {"name": name})
+        _check("setup", response, status.HTTP_201_CREATED)
+        if rrsets:
+            response = self.client.patch(
+                reverse("v1:rrsets", args=(name,)),
+                rrsets_data(rrsets, 0),
+                format="json",
+            )
+            _check("setup", response, status.HTTP_200_OK)
+        return name
+
+    def run(self, name):
+        """
+        Runs the given scenario and returns its median and 95th percentile latency (in ms), and the maximum number of
+        database queries and pdns requests per repetition.
+        """
+        steps = SCENARIOS[name](self)
+        latencies, queries, pdns_requests = [], [], []
+        for i in range(self.warmup + self.repeat):
+            request, expected_status = next(steps)
+            cache.clear()  # don't get throttled
+            pdns_before = self.standin.count()
+            query_count = 0
+
+            def count_queries(execute, *args):
+                nonlocal query_count
+                query_count += 1
+                return execute(*args)
+
+            with connection.execute_wrapper(count_queries):
+                start = time.perf_counter()
+                response = request()
+                latency = time.perf_counter() - start
+            _check(name, response, expected_status)
+            if i >= self.warmup:
+                latencies.append(latency * 1000)
+                queries.append(query_count)
+                pdns_requests.append(self.standin.count() - pdns_before)
+        return {
+            "latency_ms": {
+                "median": round(statistics.median(latencies), 2),
+                "p95": round(_percentile(latencies, 95), 2),
+            },
+            "queries": max(queries),
+            "pdns_requests": max(pdns_requests),
+        }
+
+
+def _check(name, response, expected_status):
+    if expected_status is not None and response.status_code != expected_status:
+        raise RuntimeError(
+            f"{name}: expected status {expected_status}, got {response.status_code}: "
+            f"{getattr(response, 'data', '')}"
+        )
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(percentile / 100 * (len(values) - 1)))]
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of regressions of the results against the baseline: more database queries or pdns requests than
+    before, or a median latency that is more than `tolerance` times the baseline's.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        for key in ("queries", "pdns_requests"):
+            if result[key] > before[key]:
+                regressions.append(f"{name}: {key} {before[key]} -> {result[key]}")
+        median, baseline_median = (
+            result["latency_ms"]["median"],
+            before["latency_ms"]["median"],
+        )
+        if median > baseline_median * tolerance:
+            regressions.append(
+                f"{name}: median latency {baseline_median}ms -> {median}ms"
+            )
+    return regressions
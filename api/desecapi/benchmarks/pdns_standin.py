@@ -0,0 +1,94 @@
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CRYPTOKEYS = [
+    {
+        "algorithm": "ECDSAP256SHA256",
+        "bits": 256,
+        "dnskey": "257 3 13 EVBcsqrnOp6RGWtsrr9QW8cUtt/WI5C81RcCZDTGNI9elAiMQlxRdnic+7V+b7jJDE2vgY08qAbxiNh5NdzkzA==",
+        "id": 179425943,
+        "published": True,
+        "type": "Cryptokey",
+        "flags": 257,
+        "keytype": "csk",
+        "cds": [
+            "62745 13 2 5cddaeaa383e2ea7de49bd1212bf520228f0e3b334626517e5f6a68eb85b48f6",
+        ],
+    }
+]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as with the real pdns webserver
+
+    # (method, path pattern) -> (status, body)
+    routes = [
+        ("GET", r"/zones", 200, []),
+        ("POST", r"/zones", 201, {}),
+        ("GET", r"/zones/[^/]+/cryptokeys", 200, CRYPTOKEYS),
+        ("GET", r"/zones/[^/]+/export", 200, ""),
+        ("GET", r"/zones/[^/]+", 200, {"rrsets": []}),
+        ("PATCH", r"/zones/[^/]+", 204, None),
+        ("DELETE", r"/zones/[^/]+", 204, None),
+        ("PUT", r"/zones/[^/]+/axfr-retrieve", 200, {"result": "queued"}),
+    ]
+
+    def handle_one(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server, _, path = self.path.partition("?")[0].lstrip("/").partition("/")
+        self.server.standin.record(server, self.command)
+        for method, pattern, status, body in self.routes:
+            if method == self.command and re.fullmatch(pattern, "/" + path):
+                break
+        else:
+            status, body = 404, {"error": "Not Found"}
+        body = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = handle_one
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PDNSStandIn:
+    """
+    Minimal in-process HTTP server answering the pdns API requests desecapi makes, for nslord (base URL
+    `self.url("nslord")`) and nsmaster (`self.url("nsmaster")`). Requests are answered with canned responses and
+    counted per server and method. Unlike the `responses` mock used in tests, this exercises the HTTP client path
+    (connection handling, (de)serialization) the way a real pdns server would.
+    """
+
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.lock = threading.Lock()
+        self.requests = Counter()
+
+    def url(self, server):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/{server}"
+
+    def record(self, server, method):
+        with self.lock:
+            self.requests[server, method] += 1
+
+    def count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
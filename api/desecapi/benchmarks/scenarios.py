@@ -0,0 +1,163 @@
+"""
+Benchmark scenarios. Each scenario is a generator function taking the Benchmark; everything it does before yielding is
+setup and not measured. Each yielded item is a pair of a zero-argument callable making one API request (which is
+measured) and the expected response status (None for callables that don't make a request). Generators are advanced
+once per repetition.
+"""
+
+import datetime
+import itertools
+
+from django.conf import settings
+from django.core.management import load_command_class
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from desecapi import crypto
+from desecapi.models import Domain, RRset, User
+
+SCENARIOS = {}
+
+
+def scenario(name, **kwargs):
+    def decorator(func):
+        SCENARIOS[name] = lambda bench: func(bench, **kwargs)
+        return func
+
+    return decorator
+
+
+def rrsets_data(count, i):
+    return [
+        {
+            "subname": f"host{n}",
+            "type": "A",
+            "ttl": 3600,
+            "records": [f"192.0.2.{(n + i) % 256}"],
+        }
+        for n in range(count)
+    ]
+
+
+def rrsets_bulk(bench, size, method):
+    url = reverse("v1:rrsets", args=(bench.create_domain(),))
+    request = getattr(bench.client, method)
+    for i in itertools.count():
+        data = rrsets_data(size, i)
+        yield lambda: request(url, data, format="json"), status.HTTP_200_OK
+
+
+for size in (10, 100, 1000):
+    for method in ("put", "patch"):
+        scenario(f"rrsets_bulk_{method}_{size}", size=size, method=method)(rrsets_bulk)
+
+
+@scenario("dyndns_update")
+def dyndns_update(bench):
+    name = bench.create_domain()
+    client = bench.client_class()
+    client.credentials(HTTP_AUTHORIZATION=bench.basic_auth(name))
+    url = reverse("v1:dyndns12update")
+    for i in itertools.count():
+        data = {"hostname": name, "myip": f"192.0.2.{i % 256}"}
+        yield lambda: client.get(url, data), status.HTTP_200_OK
+
+
+@scenario("domain_create")
+def domain_create(bench):
+    url = reverse("v1:domain-list")
+    for i in itertools.count():
+        data = {"name": bench.domain_name("create", i)}
+        yield lambda: bench.client.post(url, data), status.HTTP_201_CREATED
+
+
+@scenario("rrsets_list_ndjson", accept="application/x-ndjson")
+@scenario("rrsets_list", accept="application/json")
+def rrsets_list(bench, accept, size=1000):
+    url = reverse("v1:rrsets", args=(bench.create_domain(rrsets=size),))
+
+    def request():
+        response = bench.client.get(url, {"cursor": ""}, HTTP_ACCEPT=accept)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    while True:
+        yield request, status.HTTP_200_OK
+
+
+@scenario("zonefile_import")
+def zonefile_import(bench, size=1000):
+    url = reverse("v1:domain-list")
+    zonefile = "".join(f"host{n} 3600 IN A 192.0.2.{n % 256}\n" for n in range(size))
+    for i in itertools.count():
+        data = {"name": bench.domain_name("import", i), "zonefile": zonefile}
+        yield lambda: bench.client.post(url, data), status.HTTP_201_CREATED
+
+
+@scenario("scavenge_delete_1000", size=1000)
+def scavenge_delete(bench, size):
+    """
+    Deletes `size` expired domains with scavenge-unused, half of which are delegated from a local public suffix.
+    """
+    command = load_command_class("desecapi", "scavenge-unused")
+    inactive_days = 183 + 28
+    parent, _ = Domain.objects.get_or_create(
+        name=next(iter(settings.LOCAL_PUBLIC_SUFFIXES)), defaults={"owner": bench.user}
+    )
+    for i in itertools.count():
+        owner = User.objects.create_user(
+            email=f"scavenge-{i}-{bench.token.pk.hex[:8]}@desec.example",
+            password=None,
+        )
+        names = [
+            (
+                f"scavenge-{i}-{n}-{bench.token.pk.hex[:8]}.{parent.name}"
+                if n % 2
+                else bench.domain_name(f"scavenge-{i}-{n}", i)
+            )
+            for n in range(size)
+        ]
+        Domain.objects.bulk_create(Domain(name=name, owner=owner) for name in names)
+        Domain.objects.filter(owner=owner).update(
+            renewal_state=Domain.RenewalState.WARNED,
+            renewal_changed=timezone.now() - datetime.timedelta(days=7),
+            published=timezone.now() - datetime.timedelta(days=inactive_days),
+        )
+        for name in names[1::2]:
+            RRset.objects.create(
+                domain=parent,
+                subname=name.partition(".")[0],
+                type="NS",
+                ttl=3600,
+                contents=settings.DEFAULT_NS,
+            )
+        yield lambda: command.delete_domains(inactive_days), None
+
+
+@scenario("retrieve_key_uncached", cached=False)
+@scenario("retrieve_key", cached=True)
+def retrieve_key(bench, cached, number=1000):
+    """
+    Retrieves an encryption key `number` times, either through the per-process cache of derived keys, or by deriving
+    it each time.
+    """
+    label, context = b"benchmark", b"desecapi.benchmarks.retrieve_key"
+    if cached:
+
+        def request():
+            for _ in range(number):
+                crypto.retrieve_key(label=label, context=context)
+
+    else:
+        secret = settings.SECRET_KEY.encode()
+
+        def request():
+            for _ in range(number):
+                crypto._derive_urlsafe_key.__wrapped__(
+                    label=label, context=context, secret=secret
+                )
+
+    while True:
+        yield request, None
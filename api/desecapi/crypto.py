@@ -1,4 +1,5 @@
 from base64 import urlsafe_b64encode
+import functools
 
 from cryptography.fernet import Fernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
@@ -10,7 +11,8 @@ from django.utils.encoding import force_bytes
 from desecapi import metrics
 
 
-def _derive_urlsafe_key(*, label, context):
+@functools.lru_cache(maxsize=128)
+def _derive_urlsafe_key(*, label, context, secret):
     backend = default_backend()
     kdf = KBKDFHMAC(
         algorithm=hashes.SHA256(),
@@ -24,27 +26,34 @@ def _derive_urlsafe_key(*, label, context):
         fixed=None,
         backend=backend,
     )
-    key = kdf.derive(settings.SECRET_KEY.encode())
+    key = kdf.derive(secret)
     return urlsafe_b64encode(key)
 
 
+@functools.lru_cache(maxsize=128)
+def _get_fernet(key):
+    return Fernet(key=key)
+
+
 def retrieve_key(*, label, context):
-    # Keeping this function separate from key derivation gives us freedom to implement look-ups later, e.g. from cache
+    # Derived keys are cached per process; the secret is part of the cache key so that a changed SECRET_KEY is honored
     label = force_bytes(label, strings_only=True)
     context = force_bytes(context, strings_only=True)
-    return _derive_urlsafe_key(label=label, context=context)
+    return _derive_urlsafe_key(
+        label=label, context=context, secret=settings.SECRET_KEY.encode()
+    )
 
 
 def encrypt(data, *, context):
     key = retrieve_key(label=b"crypt", context=context)
-    value = Fernet(key=key).encrypt(data)
+    value = _get_fernet(key).encrypt(data)
     metrics.get("desecapi_key_encryption_success").labels(context).inc()
     return value
 
 
 def decrypt(token, *, context, ttl=None):
     key = retrieve_key(label=b"crypt", context=context)
-    f = Fernet(key=key)
+    f = _get_fernet(key)
     try:
         ret = f.extract_timestamp(token), f.decrypt(token, ttl=ttl)
         metrics.get("desecapi_key_decryption_success").labels(context).inc()
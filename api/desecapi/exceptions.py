@@ -30,6 +30,17 @@ class PDNSException(ExternalAPIException):
     pass
 
 
+class PDNSUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "DNS backend temporarily unavailable, please try again later."
+    default_code = "pdns_unavailable"
+
+    def __init__(self, wait=None):
+        # picked up by DRF's exception handler for the Retry-After header
+        self.wait = wait
+        super().__init__()
+
+
 class PCHException(ExternalAPIException):
     pass
 
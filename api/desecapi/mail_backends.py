@@ -1,4 +1,6 @@
 import logging
+import smtplib
+import threading
 
 from celery import shared_task
 from django.conf import settings
@@ -16,8 +18,17 @@ class MultiLaneEmailBackend(BaseEmailBackend):
     config = {"ignore_result": True}
     default_backend = "django.core.mail.backends.smtp.EmailBackend"
 
+    # Workers keep their connection to the mail server open across tasks of a lane. The connection is closed when it
+    # has been idle for longer than connection_idle_timeout seconds, or after sending connection_max_messages messages.
+    connection_idle_timeout = 30
+    connection_max_messages = 100
+    # (lane, connection parameters) -> (connection, messages sent, idle timer)
+    _connections = {}
+    _connections_lock = threading.Lock()
+
     def __init__(self, lane: str = None, fail_silently=False, **kwargs):
         lane = lane or next(iter(settings.TASK_CONFIG))
+        self.lane = lane
         self.config.update(name=lane, queue=lane)
         self.config.update(settings.TASK_CONFIG[lane])
         self.task_kwargs = kwargs.copy()
@@ -28,7 +39,13 @@ class MultiLaneEmailBackend(BaseEmailBackend):
 
     def send_messages(self, email_messages):
         dict_messages = [email_to_dict(msg) for msg in email_messages]
-        TASKS[self.config["name"]].delay(dict_messages, **self.task_kwargs)
+        # Celery rate limits count tasks, so rate-limited lanes get one task per message
+        if settings.TASK_CONFIG[self.lane].get("rate_limit"):
+            batches = [[message] for message in dict_messages]
+        else:
+            batches = [dict_messages] if dict_messages else []
+        for batch in batches:
+            TASKS[self.lane].delay(batch, **self.task_kwargs)
         return len(email_messages)
 
     @staticmethod
@@ -37,10 +54,94 @@ class MultiLaneEmailBackend(BaseEmailBackend):
         kwargs.setdefault(
             "backend", kwargs.pop("backbackend", MultiLaneEmailBackend.default_backend)
         )
-        with get_connection(**kwargs) as connection:
-            return connection.send_messages(
-                [dict_to_email(message) for message in messages]
+        lane = debug.get("lane")
+        messages = [dict_to_email(message) for message in messages]
+        return MultiLaneEmailBackend._send_with_lane_connection(
+            lane, messages, **kwargs
+        )
+
+    @classmethod
+    def _send_with_lane_connection(cls, lane, messages, **kwargs):
+        """
+        Sends the messages one by one, so that a failing message (e.g. with a refused recipient) does not keep the
+        others from being sent. Failures are logged and counted per message. Raises only if no connection to the mail
+        server can be established; the unsent messages are then counted as failed.
+        """
+        key = (lane, repr(sorted(kwargs.items())))
+        with cls._connections_lock:
+            connection, num_messages, timer = cls._connections.pop(key, (None, 0, None))
+        if timer is not None:
+            timer.cancel()
+        if connection is not None and not cls._is_alive(connection):
+            connection.close()
+            connection = None
+
+        num_sent = 0
+        for i, message in enumerate(messages):
+            try:
+                if connection is None:
+                    connection = get_connection(**kwargs)
+                    connection.open()  # keeps connection open after send_messages()
+                    metrics.get("desecapi_email_connections").labels(lane).inc()
+                    num_messages = 0
+            except Exception:
+                metrics.get("desecapi_email_failed").labels(lane).inc(len(messages) - i)
+                raise
+
+            try:
+                sent = connection.send_messages([message])
+            except Exception:
+                logger.exception(
+                    "Failed to send email to %s (lane %s)", message.to, lane
+                )
+                metrics.get("desecapi_email_failed").labels(lane).inc()
+                if not cls._is_alive(connection):
+                    connection.close()
+                    connection = None
+            else:
+                metrics.get("desecapi_email_sent").labels(lane).inc(sent)
+                num_sent += sent
+            num_messages += 1
+
+        if connection is None:
+            return num_sent
+        if num_messages >= cls.connection_max_messages:
+            connection.close()
+        else:
+            timer = threading.Timer(
+                cls.connection_idle_timeout, cls._close_connection, (key, connection)
             )
+            timer.daemon = True
+            with cls._connections_lock:
+                cls._connections[key] = (connection, num_messages, timer)
+            timer.start()
+        return num_sent
+
+    @staticmethod
+    def _is_alive(connection):
+        smtp = getattr(connection, "connection", None)
+        if smtp is None:
+            return True  # not an SMTP connection
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @classmethod
+    def _close_connection(cls, key, connection):
+        with cls._connections_lock:
+            if cls._connections.get(key, (None,))[0] is not connection:
+                return  # in use or already closed
+            del cls._connections[key]
+        connection.close()
+
+    @classmethod
+    def close_connections(cls):
+        with cls._connections_lock:
+            connections, cls._connections = cls._connections, {}
+        for connection, _, timer in connections.values():
+            timer.cancel()
+            connection.close()
 
     @property
     def task(self):
@@ -1,10 +1,11 @@
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
-from desecapi.exceptions import PDNSException
+from desecapi.exceptions import PDNSException, PDNSUnavailable
 from desecapi.pdns import (
     _pdns_delete,
     _pdns_get,
+    _pdns_patch,
     _pdns_post,
     NSLORD,
     NSMASTER,
@@ -18,15 +19,36 @@ class Command(BaseCommand):
     help = "Generate a catalog zone on nsmaster, based on zones known on nslord."
 
     def add_arguments(self, parser):
-        pass
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only add missing and remove extra member zones instead of recreating the catalog zone. Falls back "
+            "to creating the catalog zone if it does not exist.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Maximum number of catalog RRsets per PATCH request in incremental mode.",
+        )
 
     def handle(self, *args, **options):
+        try:
+            self.align(options["incremental"], options["batch_size"])
+        except PDNSUnavailable as e:
+            # Don't leave the catalog zone half-aligned without a clear message
+            raise CommandError(f"pdns unavailable, try again in {e.wait:.0f}s")
+
+    def align(self, incremental, batch_size):
         catalog_zone_id = pdns_id(settings.CATALOG_ZONE)
 
         # Fetch zones from NSLORD
         response = _pdns_get(NSLORD, "/zones").json()
         zones = {zone["name"] for zone in response}
 
+        if incremental and self.reconcile(catalog_zone_id, zones, batch_size):
+            return
+
         # Retrieve catalog zone serial (later reused for recreating the catalog zone, for allow for smooth rollover)
         try:
             response = _pdns_get(NSMASTER, f"/zones/{catalog_zone_id}")
@@ -70,3 +92,60 @@ class Command(BaseCommand):
 
         _pdns_post(NSMASTER, "/zones?rrsets=false", data)
         print(f"Aligned catalog zone ({len(zones)} member zones).")
+
+    @staticmethod
+    def reconcile(catalog_zone_id, zones, batch_size):
+        """
+        Brings the existing catalog zone in line with the given member zones, using PATCH requests for the differences
+        only. As pdns increments the serial with each change, it remains monotonic. Returns False if the catalog zone
+        does not exist.
+        """
+        try:
+            response = _pdns_get(NSMASTER, f"/zones/{catalog_zone_id}")
+        except PDNSException as e:
+            if e.response.status_code == 404:
+                return False
+            raise e
+
+        current = {
+            (rrset["name"], rrset["type"]): [
+                record["content"] for record in rrset["records"]
+            ]
+            for rrset in response.json()["rrsets"]
+        }
+        desired = [
+            construct_catalog_rrset(
+                subname="", qtype="NS", rdata="invalid."
+            ),  # as per the specification
+            construct_catalog_rrset(
+                subname="version", qtype="TXT", rdata='"2"'
+            ),  # as per the specification
+            *(construct_catalog_rrset(zone=zone) for zone in zones),
+        ]
+        members_suffix = f".zones.{settings.CATALOG_ZONE}."
+        extra = current.keys() - {(rrset["name"], rrset["type"]) for rrset in desired}
+        rrsets = [
+            rrset
+            for rrset in desired
+            if current.get((rrset["name"], rrset["type"]))
+            != [record["content"] for record in rrset["records"]]
+        ] + [
+            construct_catalog_rrset(
+                subname=name[: -len(f".{settings.CATALOG_ZONE}.")],
+                qtype=type_,
+                delete=True,
+            )
+            for name, type_ in sorted(extra)
+            if name.endswith(members_suffix)
+        ]
+
+        for i in range(0, len(rrsets), batch_size):
+            _pdns_patch(
+                NSMASTER,
+                f"/zones/{catalog_zone_id}",
+                {"rrsets": rrsets[i : i + batch_size]},
+            )
+        print(
+            f"Aligned catalog zone ({len(zones)} member zones, {len(rrsets)} RRsets changed)."
+        )
+        return True
@@ -0,0 +1,97 @@
+import json
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from desecapi.benchmarks.harness import Benchmark, compare
+from desecapi.benchmarks.scenarios import SCENARIOS
+
+BASELINE = Path(__file__).parents[2] / "benchmarks" / "baseline.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks API requests in a fresh test database, with an in-process pdns stand-in. Reports latency, "
+        "database queries and pdns requests per scenario, and compares them against a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenario",
+            nargs="*",
+            choices=[[]] + list(SCENARIOS),  # [] allows omitting the argument
+            help="Scenarios to run. If omitted, all scenarios are run.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of measured repetitions per scenario.",
+        )
+        parser.add_argument(
+            "--baseline",
+            type=Path,
+            default=BASELINE,
+            help="Baseline file to compare against (default: %(default)s).",
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Write the results to the baseline file instead of comparing. Scenarios that were not run are kept.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=1.5,
+            help="Factor by which the median latency may exceed the baseline's before counting as a regression.",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the test database instead of creating and destroying it.",
+        )
+
+    def handle(self, *args, **options):
+        names = options["scenario"] or list(SCENARIOS)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options["keepdb"]
+        )
+        results = {}
+        try:
+            with Benchmark(repeat=options["repeat"]) as bench:
+                for name in names:
+                    results[name] = result = bench.run(name)
+                    self.stdout.write(
+                        f"{name:<25} median {result['latency_ms']['median']:>9.2f}ms "
+                        f"p95 {result['latency_ms']['p95']:>9.2f}ms "
+                        f"{result['queries']:>5} queries "
+                        f"{result['pdns_requests']:>3} pdns requests"
+                    )
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"]
+            )
+            teardown_test_environment()
+
+        baseline_path = options["baseline"]
+        baseline = (
+            json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        )
+        if options["save_baseline"]:
+            baseline.update(results)
+            baseline_path.write_text(
+                json.dumps(baseline, indent=2, sort_keys=True) + "\n"
+            )
+            self.stdout.write(f"Baseline written to {baseline_path}.")
+            return
+
+        regressions = compare(results, baseline, options["tolerance"])
+        if regressions:
+            raise CommandError(
+                "Regressions against baseline:\n" + "\n".join(regressions)
+            )
+        self.stdout.write(f"No regressions against {baseline_path}.")
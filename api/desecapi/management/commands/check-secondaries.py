@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import timedelta
 from socket import gethostbyname
 from time import sleep
@@ -56,14 +58,41 @@ class Command(BaseCommand):
             default=1200,  # Should be sum of crontab interval and delay option (see above)
             help="Check domains that were published no longer than this many seconds ago.",
         )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=10,
+            help="Maximum number of concurrent SOA queries per secondary.",
+        )
+
+    def probe_serials(self, stack, zones, concurrency):
+        """
+        Starts SOA queries for all zones on all secondaries, with at most `concurrency` queries in flight per secondary.
+        Returns a dict mapping (zone, server) to the future of the corresponding query.
+        """
+        # One pool per secondary, so that a slow server cannot hold up queries to the others
+        executors = {
+            server: stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+            for server in self.servers
+        }
+        return {
+            (zone, server): executor.submit(query_serial, zone, server)
+            for zone in zones
+            for server, executor in executors.items()
+        }
 
-    def find_outdated_servers(self, zone, local_serial):
+    def find_outdated_servers(self, zone, local_serial, probes):
         """
         Returns a dict, the key being the outdated secondary name, and the value being the node's current zone serial.
         """
         outdated = {}
         for server in self.servers:
-            remote_serial = query_serial(zone, server)
+            try:
+                remote_serial = probes[zone, server].result()
+            except Exception as e:
+                # e.g. connection refused or a malformed response; don't abort the other checks, treat like a timeout
+                print(f"{zone} query to {self.servers[server]} failed: {e!r}")
+                remote_serial = False
             if not remote_serial or remote_serial < local_serial:
                 outdated[self.servers[server]] = remote_serial
 
@@ -99,27 +128,31 @@ class Command(BaseCommand):
 
         output = []
         timeouts = {}
-        for zone, local_serial in serials.items():
-            outdated_serials = self.find_outdated_servers(zone, local_serial)
-            for server, serial in outdated_serials.items():
-                if serial is False:
-                    timeouts.setdefault(server, [])
-                    timeouts[server].append(zone)
-            outdated_serials = {
-                k: serial
-                for k, serial in outdated_serials.items()
-                if serial is not False
-            }
-
-            if outdated_serials:
-                outdated_secondaries.update(outdated_serials.keys())
-                output.append(
-                    f"{zone} ({local_serial}) is outdated on {outdated_serials}"
+        with ExitStack() as stack:
+            probes = self.probe_serials(stack, serials, options["concurrency"])
+            for zone, local_serial in serials.items():
+                outdated_serials = self.find_outdated_servers(
+                    zone, local_serial, probes
                 )
-                print(output[-1])
-                outdated_zone_count += 1
-            else:
-                print(f"{zone} ok")
+                for server, serial in outdated_serials.items():
+                    if serial is False:
+                        timeouts.setdefault(server, [])
+                        timeouts[server].append(zone)
+                outdated_serials = {
+                    k: serial
+                    for k, serial in outdated_serials.items()
+                    if serial is not False
+                }
+
+                if outdated_serials:
+                    outdated_secondaries.update(outdated_serials.keys())
+                    output.append(
+                        f"{zone} ({local_serial}) is outdated on {outdated_serials}"
+                    )
+                    print(output[-1])
+                    outdated_zone_count += 1
+                else:
+                    print(f"{zone} ok")
 
         output.append(
             f"Checked {len(serials)} domains, {outdated_zone_count} were outdated."
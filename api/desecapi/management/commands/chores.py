@@ -15,7 +15,8 @@ class Command(BaseCommand):
     @staticmethod
     def delete_expired_captchas():
         models.Captcha.objects.filter(
-            created__lt=timezone.now() - settings.CAPTCHA_VALIDITY_PERIOD
+            created__lt=timezone.now() - settings.CAPTCHA_VALIDITY_PERIOD,
+            challenge__isnull=True,  # keep pool
         ).delete()
 
     @staticmethod
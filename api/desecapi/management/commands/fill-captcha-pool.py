@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from desecapi.models import Captcha
+
+
+class Command(BaseCommand):
+    help = "Pre-render CAPTCHA challenges until the pool of each kind is filled up to its configured size."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Number of CAPTCHAs to render before adding them to the pool.",
+        )
+
+    def handle(self, *args, **options):
+        for kind, size in settings.CAPTCHA_POOL_SIZE.items():
+            missing = (
+                size
+                - Captcha.objects.filter(kind=kind, challenge__isnull=False).count()
+            )
+            while missing > 0:
+                captchas = [
+                    Captcha(kind=kind)
+                    for _ in range(min(missing, options["batch_size"]))
+                ]
+                for captcha in captchas:
+                    captcha.challenge = captcha.generate_challenge()
+                Captcha.objects.bulk_create(captchas)
+                missing -= len(captchas)
+                if options["verbosity"] > 1:
+                    print(f"Added {len(captchas)} {kind} CAPTCHAs to pool")
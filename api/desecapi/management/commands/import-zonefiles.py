@@ -0,0 +1,84 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand
+from django.db import IntegrityError
+from django.http import HttpRequest
+from rest_framework import serializers
+from rest_framework.request import Request
+
+from desecapi import logger
+from desecapi.models import ZonefileImportJob
+from desecapi.pdns_change_tracker import PDNSChangeTracker
+from desecapi.serializers import DomainSerializer
+
+
+class Command(BaseCommand):
+    help = "Process pending zonefile import jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of RRsets to validate and insert at once.",
+        )
+
+    def handle(self, *args, **options):
+        while (job := ZonefileImportJob.claim()) is not None:
+            start = time.monotonic()
+            self.process(job, options["chunk_size"])
+            if options["verbosity"] > 1:
+                print(
+                    f"Import job {job.pk} for {job.domain.name} {job.status} "
+                    f"({job.rrsets} RRsets, {time.monotonic() - start:.1f}s)"
+                )
+
+    @staticmethod
+    def serializer_context(job):
+        """
+        Context for RRsetSerializer as in the domain creation request which scheduled the job: RRset validation checks
+        the permissions of the token which requested the import (request.auth), and depends on the request method.
+        """
+        http_request = HttpRequest()
+        http_request.method = "POST"
+        request = Request(http_request)
+        request.user = job.domain.owner
+        request.auth = job.token
+        return {"request": request}
+
+    @staticmethod
+    def process(job, chunk_size):
+        domain = job.domain
+        if job.token is None:
+            job.finish(errors=["The token which requested the import was deleted."])
+            return
+
+        try:
+            contiguous = DomainSerializer.check_zonefile(domain.name, job.zonefile)
+            with PDNSChangeTracker():
+                rrsets = DomainSerializer.import_zonefile_rrsets(
+                    domain,
+                    job.zonefile,
+                    context=Command.serializer_context(job),
+                    chunk_size=chunk_size,
+                    contiguous=contiguous,
+                )
+        except serializers.ValidationError as e:
+            if isinstance(e.detail, dict) and "zonefile" in e.detail:
+                job.finish(errors=[str(error) for error in e.detail["zonefile"]])
+            else:
+                job.finish(errors=[str(e.detail)])
+        except (IntegrityError, ValidationError):
+            # RRsets were changed while the import was pending (or running)
+            logger.warning(f"Zonefile import job {job.pk} conflicted", exc_info=True)
+            job.finish(
+                errors=[
+                    "Zonefile import conflicts with changes made to the domain in the meantime."
+                ]
+            )
+        except Exception:
+            logger.exception(f"Zonefile import job {job.pk} failed")
+            job.finish(errors=["Zonefile import failed due to an internal error."])
+        else:
+            job.finish(rrsets=rrsets)
@@ -1,11 +1,14 @@
 import argparse
 import sys
+import time
+import uuid
 
 from django.core.management import BaseCommand
 from django.template import engines
 from django.urls import resolve, reverse
+from django.utils import timezone
 
-from desecapi.models import User
+from desecapi.models import OutreachCheckpoint, User
 
 
 class Command(BaseCommand):
@@ -38,6 +41,18 @@ class Command(BaseCommand):
             default=None,
             help='Subject, default according to "reason".',
         )
+        parser.add_argument(
+            "--run",
+            default=None,
+            help="Identifier of the run. If a run with this identifier exists, it is resumed after the last user "
+            "emailed. Defaults to a new random identifier, so that repeating a command sends the email again.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of users to queue emails for at once.",
+        )
 
     def handle(self, *args, **options):
         reason = options["reason"]
@@ -70,6 +85,59 @@ class Command(BaseCommand):
                 "To send default content, specify recipients explicitly."
             )
 
-        for user in users:
-            action = serializer_class.Meta.model(user=user)
-            serializer_class(action).save(subject=subject, template=template)
+        run = options["run"] or uuid.uuid4().hex
+        checkpoint, created = OutreachCheckpoint.objects.get_or_create(
+            run=run, defaults={"reason": reason}
+        )
+        if checkpoint.finished:
+            self.stdout.write(
+                f"Run {run} already finished at {checkpoint.finished} ({checkpoint.queued} emails queued). "
+                "Use another --run identifier (or none) to start a new run."
+            )
+            return
+        if created:
+            self.stdout.write(
+                f"Starting run {run} (use --run {run} to resume if interrupted)"
+            )
+        else:
+            self.stdout.write(
+                f"Resuming run {run} after {checkpoint.queued} queued emails"
+            )
+
+        # Iterate over users in primary key order, and save progress after queuing each chunk. If interrupted between
+        # queuing and saving, the last chunk is queued again upon resumption.
+        users = users.order_by("pk")
+        queued = 0
+        start = time.monotonic()
+        while True:
+            remaining = users
+            if checkpoint.last_user_id is not None:
+                remaining = users.filter(pk__gt=checkpoint.last_user_id)
+            chunk = list(remaining[: options["chunk_size"]])
+            if not chunk:
+                break
+            messages = [
+                (
+                    user,
+                    serializer_class(
+                        serializer_class.Meta.model(user=user)
+                    ).build_email(subject=subject, template=template),
+                )
+                for user in chunk
+            ]
+            queued += User.send_emails(reason, messages, chunk_size=len(messages))
+            checkpoint.last_user_id = chunk[-1].pk
+            checkpoint.queued += len(chunk)
+            checkpoint.save()
+            elapsed = time.monotonic() - start
+            self.stdout.write(
+                f"{checkpoint.queued} emails queued ({queued / elapsed:.1f}/s)"
+            )
+
+        checkpoint.finished = timezone.now()
+        checkpoint.save()
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f"Queued {queued} emails in {elapsed:.1f}s ({queued / elapsed:.1f}/s), "
+            f"{checkpoint.queued} in total for run {run}"
+        )
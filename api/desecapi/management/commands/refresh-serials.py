@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from desecapi.views import SerialListView
+
+
+class Command(BaseCommand):
+    help = "Fetch zone serials from nsmaster and publish them for the serials endpoint."
+
+    def handle(self, *args, **options):
+        state = SerialListView.refresh()
+        if options["verbosity"] > 1:
+            print(
+                f"Published serials version {state['version']} ({len(state['serials'])} zones)"
+            )
@@ -7,16 +7,17 @@ from django.db.models import F, Max, OuterRef, Subquery
 from django.db.models.functions import Greatest
 from django.utils import timezone
 
-from desecapi import models, serializers, views
+from desecapi import models, serializers
 from desecapi.pdns_change_tracker import PDNSChangeTracker
 
-
 fresh_days = 183
 notice_days_notify = 28
 notice_days_warn = 7
 
 
 class Command(BaseCommand):
+    email_chunk_size = 100  # users whose renewal state is updated and notifications queued in one transaction
+    delete_batch_size = 1000  # expired domains deleted in one change set
     base_queryset = models.Domain.objects.exclude(
         renewal_state=models.Domain.RenewalState.IMMORTAL
     ).filter(owner__is_active=True)
@@ -59,36 +60,56 @@ class Command(BaseCommand):
 
         # Group domains by user, so that we can send one message per user
         domain_user_map = {}
-        for domain in expiry_candidates.order_by("name"):
-            if domain.owner not in domain_user_map:
-                domain_user_map[domain.owner] = []
-            domain_user_map[domain.owner].append(domain)
+        for domain in expiry_candidates.select_related("owner").order_by(
+            "owner", "name"
+        ):
+            domain_user_map.setdefault(domain.owner, []).append(domain)
+        if not domain_user_map:
+            return
 
-        # Prepare and send emails, and keep renewal status in sync
         context = {
             "deletion_date": timezone.localdate() + datetime.timedelta(days=notice_days)
         }
-        for user, domains in domain_user_map.items():
+        serializer_class = serializers.AuthenticatedRenewDomainBasicUserActionSerializer
+        users = list(domain_user_map)
+        for i in range(0, len(users), cls.email_chunk_size):
+            chunk = users[i : i + cls.email_chunk_size]
             with transaction.atomic():
-                # Update renewal status of the user's affected domains, but don't commit before sending the email
-                actions = []
-                for domain in domains:
-                    domain.renewal_state += 1
-                    domain.renewal_changed = timezone.now()
-                    domain.save(update_fields=["renewal_state", "renewal_changed"])
-                    actions.append(
+                # Update renewal status of the chunk's domains at once, but don't commit before queuing the emails
+                renewal_changed = timezone.now()
+                models.Domain.objects.filter(
+                    pk__in=[
+                        domain.pk for user in chunk for domain in domain_user_map[user]
+                    ]
+                ).update(
+                    renewal_state=renewal_state + 1, renewal_changed=renewal_changed
+                )
+
+                # Prepare one message per user (codes need to reflect the updated renewal status), and queue them
+                # as one batch
+                messages = []
+                for user in chunk:
+                    domains = domain_user_map[user]
+                    for domain in domains:
+                        domain.renewal_state = renewal_state + 1
+                        domain.renewal_changed = renewal_changed
+                    actions = [
                         models.AuthenticatedRenewDomainBasicUserAction(
                             user=user, domain=domain
                         )
-                    )
-                serializers.AuthenticatedRenewDomainBasicUserActionSerializer(
-                    actions, many=True, context=context
-                ).save()
+                        for domain in domains
+                    ]
+                    serializer = serializer_class(actions, many=True, context=context)
+                    messages.append((user, serializer.build_email()))
+                models.User.send_emails(
+                    serializer_class.reason, messages, chunk_size=len(messages)
+                )
 
     @classmethod
     def delete_domains(cls, inactive_days):
-        expired_domains = (
-            cls.base_queryset.filter(renewal_state=models.Domain.RenewalState.WARNED)
+        expired_domains = list(
+            cls.base_queryset.select_related("owner")
+            .filter(renewal_state=models.Domain.RenewalState.WARNED)
             .annotate(last_active=Greatest(cls._max_touched, "published"))
             .filter(
                 renewal_changed__date__lte=timezone.localdate()
@@ -96,17 +117,31 @@ class Command(BaseCommand):
                 last_active__date__lte=timezone.localdate()
                 - datetime.timedelta(days=inactive_days),
             )
+            .order_by("name")
         )
-
-        for domain in expired_domains:
+        # Process in batches, so that a failure only rolls back the current batch. Each batch is deleted in one
+        # change set (one catalog and PCH update), and its delegations are removed with one update per parent zone.
+        for i in range(0, len(expired_domains), cls.delete_batch_size):
+            batch = expired_domains[i : i + cls.delete_batch_size]
             with PDNSChangeTracker():
-                domain.delete()
-            if not domain.owner.domains.exists():
-                domain.owner.delete()
-        # Do one large delegation update
-        with PDNSChangeTracker():
-            for domain in expired_domains:
-                views.DomainViewSet.auto_delegate(domain)
+                for domain in batch:
+                    domain.delete()
+
+            # Delete users whose last domain was purged
+            for user in models.User.objects.filter(
+                pk__in={domain.owner_id for domain in batch},
+                domains__isnull=True,
+            ):
+                user.delete()
+
+            delegations = {}
+            for domain in batch:
+                if domain.is_locally_registrable:
+                    delegations.setdefault(domain.parent_domain_name, []).append(domain)
+            if delegations:
+                with PDNSChangeTracker():
+                    for parent in models.Domain.objects.filter(name__in=delegations):
+                        parent.update_delegations(delegations[parent.name])
 
     def handle(self, *args, **kwargs):
         try:
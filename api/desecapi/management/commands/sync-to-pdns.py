@@ -1,12 +1,31 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import dns.exception
 from django.core.management import BaseCommand, CommandError, call_command
-from django.db import transaction
+from django.db import connection, transaction
 
 from desecapi import pdns
-from desecapi.exceptions import PDNSException
-from desecapi.models import Domain
+from desecapi.exceptions import PDNSException, PDNSUnavailable
+from desecapi.models import Domain, RR
 from desecapi.pdns_change_tracker import PDNSChangeTracker
 
 
+def canonical_records(type_, contents):
+    """
+    Returns the given record contents sorted and in canonical presentation format (as stored in the API database), so
+    that records which pdns presents differently are not taken for changes. Contents that cannot be parsed are
+    returned as they are.
+    """
+    try:
+        return sorted(
+            RR.canonical_presentation_format(content, type_) for content in contents
+        )
+    except (ValueError, dns.exception.DNSException):
+        return sorted(contents)
+
+
 class Command(BaseCommand):
     help = "Sync RRsets from local API database to pdns."
 
@@ -16,6 +35,17 @@ class Command(BaseCommand):
             nargs="*",
             help="Domain name to sync. If omitted, will import all API domains.",
         )
+        parser.add_argument(
+            "--diff",
+            action="store_true",
+            help="Only write RRsets that differ from pdns, and skip the AXFR for zones that are in sync.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of domains to sync concurrently.",
+        )
 
     def handle(self, *args, **options):
         domains = Domain.objects.all()
@@ -28,22 +58,64 @@ class Command(BaseCommand):
                 if domain_name not in domain_names:
                     raise CommandError("{} is not a known domain".format(domain_name))
 
-        catalog_alignment = False
-        for domain in domains:
-            self.stdout.write("%s ..." % domain.name, ending="")
+        domains = list(domains)
+        sync_domain = self._sync_domain_diff if options["diff"] else self._sync_domain
+
+        def process(domain):
             try:
-                created = self._sync_domain(domain)
-                if created:
-                    self.stdout.write(f" created (was missing) ...", ending="")
-                    catalog_alignment = True
-                self.stdout.write(" synced")
+                return sync_domain(domain), None
             except Exception as e:
-                self.stdout.write(" failed")
-                msg = "Error while processing {}: {}".format(domain.name, e)
-                raise CommandError(msg)
+                return None, e
+            finally:
+                if options["workers"] > 1:
+                    connection.close()  # each worker thread has its own connection
 
-        if catalog_alignment:
-            call_command("align-catalog-zone")
+        stats = Counter()
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            results = (
+                executor.map(process, domains)
+                if options["workers"] > 1
+                else map(process, domains)
+            )
+            for i, (domain, (result, e)) in enumerate(zip(domains, results), 1):
+                prefix = f"[{i}/{len(domains)}] {domain.name} ..."
+                if e is not None:
+                    executor.shutdown(cancel_futures=True)
+                    self.stdout.write(f"{prefix} failed")
+                    if isinstance(e, PDNSUnavailable):
+                        # The remaining domains would fail alike
+                        msg = "pdns unavailable while processing {}, try again in {:.0f}s".format(
+                            domain.name, e.wait
+                        )
+                    else:
+                        msg = "Error while processing {}: {}".format(domain.name, e)
+                    raise CommandError(msg)
+
+                created, written = result
+                status = []
+                if created:
+                    status.append("created (was missing)")
+                    stats["created"] += 1
+                if created or written:
+                    status.append(f"synced ({written} RRsets written)")
+                    stats["synced"] += 1
+                else:
+                    status.append("in sync")
+                    stats["in sync"] += 1
+                stats["RRsets written"] += written
+                self.stdout.write(f"{prefix} {' ... '.join(status)}")
+
+        self.stdout.write(
+            f"Processed {len(domains)} domains in {time.monotonic() - start:.1f}s: "
+            + ", ".join(
+                f"{stats[key]} {key}"
+                for key in ("created", "synced", "in sync", "RRsets written")
+            )
+        )
+
+        if stats["created"]:
+            call_command("align-catalog-zone", "--incremental")
 
     @staticmethod
     @transaction.atomic
@@ -60,6 +132,7 @@ class Command(BaseCommand):
             else:
                 raise e
         else:
+            pdns.update_catalog([domain.name])
             created = True
 
         # modifications actually merged with additions in CreateUpdateDeleteRRSets
@@ -79,4 +152,53 @@ class Command(BaseCommand):
             pdns.NSMASTER, "/zones/{}/axfr-retrieve".format(pdns.pdns_id(domain.name))
         )
 
-        return created
+        return created, len(modifications | deletions)
+
+    @staticmethod
+    @transaction.atomic
+    def _sync_domain_diff(domain):
+        created = False
+
+        # Retrieve zone from pdns, and create it if it does not exist
+        try:
+            current = {
+                (rrset["type"], rrset["subname"]): (
+                    rrset["ttl"],
+                    canonical_records(rrset["type"], rrset["records"]),
+                )
+                for rrset in pdns.get_rrset_datas(domain)
+            }
+        except PDNSException as e:
+            if e.response.status_code not in (404, 422):
+                raise e
+            PDNSChangeTracker.CreateDomain(domain_name=domain.name).pdns_do()
+            pdns.update_catalog([domain.name])
+            current = {}
+            created = True
+        current.pop(("SOA", ""), None)  # do not touch SOA record
+
+        desired = {
+            (rrset.type, rrset.subname): (
+                rrset.ttl,
+                sorted(rr.content for rr in rrset.records.all()),
+            )
+            for rrset in domain.rrset_set.prefetch_related("records")
+        }
+        desired = {key: value for key, value in desired.items() if value[1]}
+
+        modifications = {
+            key for key, value in desired.items() if current.get(key) != value
+        }
+        deletions = current.keys() - desired.keys()
+        if not (created or modifications or deletions):
+            return created, 0
+
+        # Update zone on nslord, propagate to nsmaster
+        PDNSChangeTracker.CreateUpdateDeleteRRSets(
+            domain.name, set(), modifications, deletions
+        ).pdns_do()
+        pdns._pdns_put(
+            pdns.NSMASTER, "/zones/{}/axfr-retrieve".format(pdns.pdns_id(domain.name))
+        )
+
+        return created, len(modifications | deletions)
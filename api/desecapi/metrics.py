@@ -2,6 +2,8 @@ from prometheus_client import Counter, Histogram
 
 metrics = {}
 
+BODY_SIZE_BUCKETS = tuple(4**i * 1024 for i in range(9))  # 1 KiB ... 64 MiB
+
 
 def get(name):
     return metrics.get(name)
@@ -15,19 +17,53 @@ def set_histogram(name, *args, **kwargs):
     metrics[name] = Histogram(name, *args, **kwargs)
 
 
+# middleware.py metrics
+set_histogram(
+    "desecapi_view_db_queries",
+    "number of database queries per request",
+    ["view", "method"],
+    buckets=[0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf")],
+)
+set_histogram(
+    "desecapi_view_db_time",
+    "time spent on database queries per request in seconds",
+    ["view", "method"],
+    unit="seconds",
+)
+
 # models metrics
 set_counter(
     "desecapi_captcha_content_created",
     "number of times captcha content created",
     ["kind"],
 )
+set_counter(
+    "desecapi_captcha_pool",
+    "number of captchas claimed from the pool (hit) or generated on demand (miss)",
+    ["kind", "result"],
+)
 set_counter("desecapi_autodelegation_created", "number of autodelegations added")
 set_counter("desecapi_autodelegation_deleted", "number of autodelegations deleted")
 set_histogram(
     "desecapi_messages_queued",
-    "number of emails queued",
+    "number of emails queued per batch (user is the recipient's id for single emails, or bulk)",
     ["reason", "user", "lane"],
-    buckets=[0, 1, float("inf")],
+    buckets=[0, 1, 10, 100, float("inf")],
+)
+
+set_counter(
+    "desecapi_zonefile_cache",
+    "number of zonefile exports served from cache (hit) or from nslord (miss)",
+    ["result"],
+)
+
+# mail_backends.py metrics
+set_counter("desecapi_email_sent", "number of emails delivered", ["lane"])
+set_counter("desecapi_email_failed", "number of emails failed to deliver", ["lane"])
+set_counter(
+    "desecapi_email_connections",
+    "number of connections opened to the mail server",
+    ["lane"],
 )
 
 # views metrics
@@ -76,6 +112,34 @@ set_counter(
     "number of times pdns request failed",
     ["method", "path", "status"],
 )
+set_counter(
+    "desecapi_pdns_request_retry",
+    "number of times pdns request was retried",
+    ["method", "reason"],
+)
+set_counter(
+    "desecapi_pdns_circuit_breaker_opened",
+    "number of times the circuit breaker for a pdns server opened",
+    ["server"],
+)
+set_counter(
+    "desecapi_pdns_circuit_breaker_rejected",
+    "number of pdns requests rejected by an open circuit breaker",
+    ["server"],
+)
+set_histogram(
+    "desecapi_pdns_request_duration",
+    "duration of pdns requests in seconds",
+    ["server", "method", "path"],
+    unit="seconds",
+)
+set_histogram(
+    "desecapi_pdns_request_body_size",
+    "size of pdns request bodies in bytes",
+    ["server", "method", "path"],
+    unit="bytes",
+    buckets=BODY_SIZE_BUCKETS,
+)
 set_counter("desecapi_pdns_keys_fetched", "number of times pdns keys were fetched")
 
 # pch.py metrics
@@ -89,6 +153,19 @@ set_counter(
     "number of times PCH request failed",
     ["method", "path", "status"],
 )
+set_histogram(
+    "desecapi_pch_request_duration",
+    "duration of PCH requests in seconds",
+    ["method", "path"],
+    unit="seconds",
+)
+set_histogram(
+    "desecapi_pch_request_body_size",
+    "size of PCH request bodies in bytes",
+    ["method", "path"],
+    unit="bytes",
+    buckets=BODY_SIZE_BUCKETS,
+)
 
 
 # pdns_change_tracker.py metrics
@@ -96,6 +173,12 @@ set_counter(
     "desecapi_pdns_catalog_updated",
     "number of times pdns catalog was updated successfully",
 )
+set_histogram(
+    "desecapi_pdns_change_tracker_phase_duration",
+    "duration of the phases of applying tracked changes in seconds",
+    ["phase"],
+    unit="seconds",
+)
 
 # throttling.py metrics
 set_counter(
@@ -0,0 +1,108 @@
+import logging
+import random
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+from desecapi import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(sql):
+    """
+    Returns the given SQL with literals and parameter lists collapsed, so that queries which only differ in their
+    parameters (such as those of an N+1 pattern) share a fingerprint.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+\b", "?", sql)
+    sql = re.sub(r"%s", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(...)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+class QueryMetricsMiddleware:
+    """
+    Records the number of database queries and the time spent on them for a sample of requests
+    (QUERY_METRICS_SAMPLE_RATE), labelled by view and method. Sampled requests that take longer than
+    QUERY_METRICS_SLOW_REQUEST seconds are logged along with their most frequent query fingerprints.
+
+    Only queries on the request thread's connection are counted (not, e.g., those of PDNSChangeTracker workers). For
+    streaming responses, queries made while the response is consumed are included, and observation happens when the
+    stream ends.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.random = random.Random()  # leave the global generator's sequence alone
+
+    def __call__(self, request):
+        if self.random.random() >= settings.QUERY_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        queries = []
+
+        def execute_wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((sql, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(execute_wrapper):
+            response = self.get_response(request)
+
+        if response.streaming and not response.is_async:
+            # Streaming views run their queries while the response is consumed
+            response.streaming_content = self._stream(
+                response.streaming_content,
+                execute_wrapper,
+                lambda: self._observe(request, queries, start),
+            )
+        else:
+            self._observe(request, queries, start)
+        return response
+
+    @staticmethod
+    def _stream(content, execute_wrapper, observe):
+        try:
+            with connection.execute_wrapper(execute_wrapper):
+                yield from content
+        finally:
+            observe()  # also when the client went away
+
+    @staticmethod
+    def _observe(request, queries, start):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        if match is None:
+            return
+        view = getattr(match.func, "view_class", match.func).__name__
+        db_time = sum(query_time for _, query_time in queries)
+        metrics.get("desecapi_view_db_queries").labels(view, request.method).observe(
+            len(queries)
+        )
+        metrics.get("desecapi_view_db_time").labels(view, request.method).observe(
+            db_time
+        )
+
+        slow = settings.QUERY_METRICS_SLOW_REQUEST
+        if slow is not None and duration >= slow:
+            fingerprints = Counter(fingerprint(sql) for sql, _ in queries)
+            logger.warning(
+                "Slow request: %s %s (%s) took %.3fs, %d queries in %.3fs. Most frequent queries:\n%s",
+                request.method,
+                request.path,
+                view,
+                duration,
+                len(queries),
+                db_time,
+                "\n".join(
+                    f"{count:5d} {sql}" for sql, count in fingerprints.most_common(10)
+                ),
+            )
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("desecapi", "0046_remove_rr_unique_record_in_rrset_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutreachCheckpoint",
+            fields=[
+                (
+                    "run",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("reason", models.CharField(max_length=64)),
+                ("last_user_id", models.UUIDField(null=True)),
+                ("queued", models.PositiveIntegerField(default=0)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                ("finished", models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
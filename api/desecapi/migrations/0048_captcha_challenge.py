@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("desecapi", "0047_outreachcheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="captcha",
+            name="challenge",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name="captcha",
+            index=models.Index(
+                condition=models.Q(("challenge__isnull", False)),
+                fields=["kind", "created"],
+                name="captcha_pool_idx",
+            ),
+        ),
+    ]
@@ -5,6 +5,7 @@ from .captcha import Captcha
 from .domains import Domain
 from .donation import Donation
 from .mfa import BaseFactor, TOTPFactor
+from .outreach import OutreachCheckpoint
 from .records import (
     RR,
     RRset,
@@ -16,3 +17,4 @@ from .records import (
 )
 from .tokens import Token, TokenDomainPolicy
 from .users import User
+from .zonefile_import import ZonefileImportJob
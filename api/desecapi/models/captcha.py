@@ -4,8 +4,10 @@ import secrets
 import string
 import uuid
 
+from captcha.audio import AudioCaptcha
+from captcha.image import ImageCaptcha
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django_prometheus.models import ExportModelOperationsMixin
 
@@ -38,12 +40,54 @@ class Captcha(ExportModelOperationsMixin("Captcha"), models.Model):
     created = models.DateTimeField(auto_now_add=True, db_index=True)
     content = models.CharField(max_length=24, default="")
     kind = models.CharField(choices=Kind.choices, default=Kind.IMAGE, max_length=24)
+    challenge = models.BinaryField(null=True)  # only set while in pool
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["kind", "created"],
+                condition=models.Q(challenge__isnull=False),
+                name="captcha_pool_idx",
+            ),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if not self.content:
             self.content = captcha_default_content(self.kind)
 
+    def generate_challenge(self) -> bytes:
+        if self.kind == Captcha.Kind.IMAGE:
+            return ImageCaptcha().generate(self.content).getvalue()
+        elif self.kind == Captcha.Kind.AUDIO:
+            return AudioCaptcha().generate(self.content)
+        else:
+            raise ValueError(f"Unknown captcha type {self.kind}")
+
+    @classmethod
+    def claim(cls, kind: str = Kind.IMAGE) -> Captcha:
+        """
+        Takes a CAPTCHA with pre-rendered challenge from the pool (see `fill-captcha-pool` command), or creates a new
+        one if the pool is empty. The challenge of a claimed CAPTCHA is only kept in memory.
+        """
+        with transaction.atomic():
+            captcha = (
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(kind=kind, challenge__isnull=False)
+                .order_by("created")
+                .first()
+            )
+            if captcha is None:
+                metrics.get("desecapi_captcha_pool").labels(kind, "miss").inc()
+                return cls.objects.create(kind=kind)
+            challenge = bytes(captcha.challenge)
+            captcha.challenge = None
+            captcha.created = timezone.now()  # validity period starts now
+            captcha.save(update_fields=["challenge", "created"])
+        metrics.get("desecapi_captcha_pool").labels(kind, "hit").inc()
+        captcha.challenge = challenge
+        return captcha
+
     def verify(self, solution: str):
         age = timezone.now() - self.created
         self.delete()
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
+import secrets
+from contextlib import closing
 from functools import cached_property
 
 import dns
 import psl_dns
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import CharField, F, Manager, Q, Value
+from django.db.models import CharField, F, Manager, Max, Q, Value
 from django.db.models.functions import Concat, Length
 from django_prometheus.models import ExportModelOperationsMixin
 from dns.exception import Timeout
@@ -217,10 +220,10 @@ class Domain(ExportModelOperationsMixin("Domain"), models.Model):
     @property
     def touched(self):
         try:
-            rrset_touched = max(
-                updated for updated in self.rrset_set.values_list("touched", flat=True)
-            )
-        except ValueError:  # no RRsets (but there should be at least NS)
+            rrset_touched = self.rrset_touched  # annotated by some querysets
+        except AttributeError:
+            rrset_touched = self.rrset_set.aggregate(Max("touched"))["touched__max"]
+        if rrset_touched is None:  # no RRsets (but there should be at least NS)
             return self.published  # may be None if the domain was never published
         return max(rrset_touched, self.published or rrset_touched)
 
@@ -246,53 +249,142 @@ class Domain(ExportModelOperationsMixin("Domain"), models.Model):
 
     @property
     def zonefile(self):
-        return pdns.get_zonefile(self)
+        return b"".join(self.iter_zonefile())
+
+    # Cached exports are split into items, so that exports of any size fit into memcached (which we run with
+    # `-I 32m`, see docker-compose.yml) and can be served without holding the whole export in memory
+    zonefile_cache_chunk_size = 512 * 1024
+    zonefile_cache_timeout = 24 * 3600
+
+    @property
+    def _zonefile_cache_key(self):
+        # Identifies the version of the zone on nslord; a new one starts whenever the zone changed there
+        version_key = f"desecapi.zonefile.{self.name}"
+        version = cache.get_or_set(version_key, secrets.token_hex(8), timeout=None)
+        return f"{version_key}.{self.pk}.{version}"
+
+    @classmethod
+    def invalidate_zonefile_cache(cls, name):
+        """
+        Discards the cached export of the given zone. To be called after the zone was changed on nslord (independently
+        of the database transaction and the AXFR, which may fail), so that exports which were already running when
+        the zone changed don't end up cached for the new version.
+        """
+        cache.delete(f"desecapi.zonefile.{name}")
+
+    def iter_zonefile(self):
+        """
+        Returns an iterator over the zonefile (presentation format) in binary chunks. Exports are cached per version
+        of the zone; on a cache miss, the export is streamed from nslord and stored as it passes through. The cache
+        entry only becomes visible once the export was read completely.
+        """
+        if self.published is None:
+            return pdns.iter_zonefile(self)
+
+        key = self._zonefile_cache_key
+        count = cache.get(key)
+        if count is None:
+            metrics.get("desecapi_zonefile_cache").labels("miss").inc()
+            return self._iter_zonefile_and_cache(key, pdns.iter_zonefile(self))
+        metrics.get("desecapi_zonefile_cache").labels("hit").inc()
+        return self._iter_zonefile_cached(key, count)
+
+    def _iter_zonefile_and_cache(self, key, chunks):
+        buffer, count = b"", 0
+        # Release the nslord connection also when the client goes away
+        with closing(chunks):
+            for chunk in chunks:
+                yield chunk
+                buffer += chunk
+                while len(buffer) >= self.zonefile_cache_chunk_size:
+                    cache.set(
+                        f"{key}.{count}",
+                        buffer[: self.zonefile_cache_chunk_size],
+                        timeout=self.zonefile_cache_timeout,
+                    )
+                    buffer = buffer[self.zonefile_cache_chunk_size :]
+                    count += 1
+        if buffer:
+            cache.set(f"{key}.{count}", buffer, timeout=self.zonefile_cache_timeout)
+            count += 1
+        cache.set(key, count, timeout=self.zonefile_cache_timeout)
+
+    def _iter_zonefile_cached(self, key, count):
+        offset = 0
+        for i in range(count):
+            chunk = cache.get(f"{key}.{i}")
+            if chunk is None:
+                # Part of the entry was evicted after we started sending; resume from nslord at the current offset
+                cache.delete(key)
+                with closing(pdns.iter_zonefile(self)) as chunks:
+                    for chunk in chunks:
+                        if offset >= len(chunk):
+                            offset -= len(chunk)
+                            continue
+                        yield chunk[offset:]
+                        offset = 0
+                return
+            offset += len(chunk)
+            yield chunk
 
     def save(self, *args, **kwargs):
         self.full_clean(validate_unique=False)
         super().save(*args, **kwargs)
 
     def update_delegation(self, child_domain: Domain):
-        child_subname, child_domain_name = child_domain._partitioned_name
-        if self.name != child_domain_name:
-            raise ValueError(
-                "Cannot update delegation of %s as it is not an immediate child domain of %s."
-                % (child_domain.name, self.name)
-            )
+        self.update_delegations([child_domain])
+
+    def update_delegations(self, child_domains: list[Domain]):
+        """
+        Updates the delegations of several immediate child domains. Delegations of existing children are (re-)set,
+        those of deleted children are removed.
+        """
+        child_subnames = {}
+        for child_domain in child_domains:
+            child_subname, child_domain_name = child_domain._partitioned_name
+            if self.name != child_domain_name:
+                raise ValueError(
+                    "Cannot update delegation of %s as it is not an immediate child domain of %s."
+                    % (child_domain.name, self.name)
+                )
+            child_subnames[child_subname] = child_domain
 
         # Always remove delegation so that we con properly recreate it
+        delegated = set()
         for rrset in self.rrset_set.filter(
-            subname=child_subname, type__in=["NS", "DS"]
+            subname__in=child_subnames, type__in=["NS", "DS"]
         ):
             rrset.delete()
+            delegated.add(rrset.subname)
+
+        for child_subname, child_domain in child_subnames.items():
+            if child_domain.pk:
+                # Domain real: (re-)set delegation
+                child_keys = child_domain.keys
+                if not child_keys:
+                    raise APIException(
+                        "Cannot delegate %s, as it currently has no keys."
+                        % child_domain.name
+                    )
 
-        if child_domain.pk:
-            # Domain real: (re-)set delegation
-            child_keys = child_domain.keys
-            if not child_keys:
-                raise APIException(
-                    "Cannot delegate %s, as it currently has no keys."
-                    % child_domain.name
+                RRset.objects.create(
+                    domain=self,
+                    subname=child_subname,
+                    type="NS",
+                    ttl=3600,
+                    contents=settings.DEFAULT_NS,
                 )
-
-            RRset.objects.create(
-                domain=self,
-                subname=child_subname,
-                type="NS",
-                ttl=3600,
-                contents=settings.DEFAULT_NS,
-            )
-            RRset.objects.create(
-                domain=self,
-                subname=child_subname,
-                type="DS",
-                ttl=300,
-                contents=[ds for k in child_keys for ds in k["ds"]],
-            )
-            metrics.get("desecapi_autodelegation_created").inc()
-        else:
-            # Domain not real: that's it
-            metrics.get("desecapi_autodelegation_deleted").inc()
+                RRset.objects.create(
+                    domain=self,
+                    subname=child_subname,
+                    type="DS",
+                    ttl=300,
+                    contents=[ds for k in child_keys for ds in k["ds"]],
+                )
+                metrics.get("desecapi_autodelegation_created").inc()
+            elif child_subname in delegated:
+                # Domain not real: that's it
+                metrics.get("desecapi_autodelegation_deleted").inc()
 
     def delete(self, *args, **kwargs):
         ret = super().delete(*args, **kwargs)
@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class OutreachCheckpoint(models.Model):
+    """
+    Progress of an outreach email run. Users are processed in primary key order, so that a run can be resumed after
+    the last user for whom an email was queued.
+    """
+
+    run = models.CharField(max_length=64, primary_key=True)
+    reason = models.CharField(max_length=64)
+    last_user_id = models.UUIDField(null=True)
+    queued = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True)
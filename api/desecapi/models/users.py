@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import functools
 import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.core.mail import EmailMessage, get_connection
 from django.db import models
+from django.template.base import TextNode
 from django.template.loader import get_template
 from django.utils import timezone
 from django_prometheus.models import ExportModelOperationsMixin
@@ -13,6 +15,23 @@ from django_prometheus.models import ExportModelOperationsMixin
 from desecapi import logger, metrics
 
 
+@functools.cache
+def _get_email_template(name):
+    """
+    Returns the compiled email template with the given name, and its rendered text if it does not depend on the
+    context (otherwise None). Templates are loaded once per process.
+    """
+    template = get_template(name)
+    if all(isinstance(node, TextNode) for node in template.template.nodelist):
+        return template, template.render()
+    return template, None
+
+
+def _render_email_template(name, context=None):
+    template, text = _get_email_template(name)
+    return text if text is not None else template.render(context)
+
+
 class MyUserManager(BaseUserManager):
     def create_user(self, email, password, **extra_fields):
         """
@@ -126,51 +145,77 @@ class User(ExportModelOperationsMixin("User"), AbstractBaseUser):
                 )
         super().save(*args, **kwargs)
 
-    def send_email(
+    _email_lanes = {
+        "activate-account": "email_slow_lane",
+        "activate-account-with-override-token": "email_fast_lane",
+        "change-email": "email_slow_lane",
+        "change-email-confirmation-old-email": "email_fast_lane",
+        "change-outreach-preference": "email_slow_lane",
+        "confirm-account": "email_slow_lane",
+        "create-totp": "email_fast_lane",
+        "password-change-confirmation": "email_fast_lane",
+        "reset-password": "email_fast_lane",
+        "delete-account": "email_fast_lane",
+        "domain-dyndns": "email_fast_lane",
+        "renew-domain": "email_immediate_lane",
+    }
+
+    def build_email(
         self, reason, context=None, recipient=None, subject=None, template=None
     ):
-        fast_lane = "email_fast_lane"
-        slow_lane = "email_slow_lane"
-        immediate_lane = "email_immediate_lane"
-        lanes = {
-            "activate-account": slow_lane,
-            "activate-account-with-override-token": fast_lane,
-            "change-email": slow_lane,
-            "change-email-confirmation-old-email": fast_lane,
-            "change-outreach-preference": slow_lane,
-            "confirm-account": slow_lane,
-            "create-totp": fast_lane,
-            "password-change-confirmation": fast_lane,
-            "reset-password": fast_lane,
-            "delete-account": fast_lane,
-            "domain-dyndns": fast_lane,
-            "renew-domain": immediate_lane,
-        }
-        if reason not in lanes:
+        """
+        Renders an email to the user, without sending it. See `send_emails()`.
+        """
+        if reason not in self._email_lanes:
             raise ValueError(
                 f"Cannot send email to user {self.pk} without a good reason: {reason}"
             )
 
         context = context or {}
-        template = template or get_template(f"emails/{reason}/content.txt")
-        content = template.render(context)
+        if template is None:
+            content = _render_email_template(f"emails/{reason}/content.txt", context)
+        else:
+            content = template.render(context)
         content += f"\nSupport Reference: user_id = {self.pk}\n"
 
-        logger.warning(
-            f"Queuing email for user account {self.pk} (reason: {reason}, lane: {lanes[reason]})"
-        )
-        num_queued = EmailMessage(
+        return EmailMessage(
             subject=(
-                subject or get_template(f"emails/{reason}/subject.txt").render(context)
+                subject
+                or _render_email_template(f"emails/{reason}/subject.txt", context)
             ).strip(),
             body=content,
-            from_email=get_template("emails/from.txt").render(),
+            from_email=_render_email_template("emails/from.txt"),
             to=[recipient or self.email],
-            connection=get_connection(
-                lane=lanes[reason], debug={"user": self.pk, "reason": reason}
-            ),
-        ).send()
-        metrics.get("desecapi_messages_queued").labels(
-            reason, self.pk, lanes[reason]
-        ).observe(num_queued)
+        )
+
+    def send_email(
+        self, reason, context=None, recipient=None, subject=None, template=None
+    ):
+        message = self.build_email(reason, context, recipient, subject, template)
+        return self.send_emails(reason, [(self, message)])
+
+    @classmethod
+    def send_emails(cls, reason, messages, chunk_size=100):
+        """
+        Queues the given (user, message) pairs on the lane for `reason`. Messages are passed to the email backend in
+        chunks of `chunk_size`, so that each chunk is delivered by one email task.
+        """
+        lane = cls._email_lanes[reason]
+        num_queued = 0
+        for i in range(0, len(messages), chunk_size):
+            chunk = messages[i : i + chunk_size]
+            pks = [user.pk for user, _ in chunk]
+            for pk in pks:
+                logger.warning(
+                    f"Queuing email for user account {pk} (reason: {reason}, lane: {lane})"
+                )
+            connection = get_connection(
+                lane=lane,
+                debug={"user": pks[0] if len(pks) == 1 else pks, "reason": reason},
+            )
+            num = connection.send_messages([message for _, message in chunk])
+            metrics.get("desecapi_messages_queued").labels(
+                reason, pks[0] if len(pks) == 1 else "bulk", lane
+            ).observe(num)
+            num_queued += num
         return num_queued
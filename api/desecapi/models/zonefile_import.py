@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import uuid
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_prometheus.models import ExportModelOperationsMixin
+
+
+class ZonefileImportJob(ExportModelOperationsMixin("ZonefileImportJob"), models.Model):
+    """
+    Zonefile import that is processed in the background (see `import-zonefiles` command) after domain creation.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        SUCCEEDED = "succeeded"
+        FAILED = "failed"
+
+    # Running jobs which have not finished after this time are assumed to have crashed, and are retried
+    stale_after = timedelta(hours=1)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    domain = models.ForeignKey(
+        "Domain", on_delete=models.CASCADE, related_name="import_jobs"
+    )
+    token = models.ForeignKey(
+        "Token", on_delete=models.SET_NULL, null=True
+    )  # permissions to apply on import
+    zonefile = models.TextField()  # cleared when finished
+    status = models.CharField(
+        choices=Status.choices, default=Status.PENDING, max_length=16
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    rrsets = models.PositiveIntegerField(default=0)  # number of imported RRsets
+    errors = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created"],
+                condition=Q(status__in=["pending", "running"]),
+                name="zonefileimportjob_open_idx",
+            ),
+        ]
+
+    @classmethod
+    def claim(cls) -> ZonefileImportJob | None:
+        """
+        Marks the oldest pending (or stale running) job as running and returns it, or returns None if there is none.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=cls.Status.PENDING)
+                    | Q(status=cls.Status.RUNNING, started__lt=now - cls.stale_after)
+                )
+                .order_by("created")
+                .first()
+            )
+            if job is not None:
+                job.status = cls.Status.RUNNING
+                job.started = now
+                job.save(update_fields=["status", "started"])
+        return job
+
+    def finish(self, *, rrsets=0, errors=None):
+        self.status = self.Status.FAILED if errors else self.Status.SUCCEEDED
+        self.finished = timezone.now()
+        self.rrsets = rrsets
+        self.errors = errors or []
+        self.zonefile = ""
+        self.save()
@@ -22,30 +22,36 @@ class LinkHeaderCursorPagination(CursorPagination):
         ]
         return {"Link": ", ".join(links)} if links else {}
 
-    def get_paginated_response(self, data):
-        pagination_required = self.has_next or self.has_previous
-        if not pagination_required:
-            return Response(data)
+    pagination_required = False
 
+    def get_paginated_response(self, data):
         url = self.request.build_absolute_uri()
         pagination_map = {
             "first": replace_query_param(url, self.cursor_query_param, "")
         }
 
-        if self.cursor_query_param not in self.request.query_params:
-            count = self.queryset.count()
+        if self.pagination_required:
             data = {
-                "detail": f"Pagination required. You can query up to {self.page_size} items at a time ({count} total). "
+                "detail": f"Pagination required. You can query up to {self.page_size} items at a time. "
                 "Please use the `first` page link (see Link header).",
             }
             headers = self.construct_headers(pagination_map)
             return Response(data, headers=headers, status=status.HTTP_400_BAD_REQUEST)
 
+        if not (self.has_next or self.has_previous):
+            return Response(data)
+
         pagination_map.update(prev=self.get_previous_link(), next=self.get_next_link())
         headers = self.construct_headers(pagination_map)
         return Response(data, headers=headers)
 
     def paginate_queryset(self, queryset, request, view=None):
         self.request = request
-        self.queryset = queryset
+        if self.cursor_query_param not in request.query_params:
+            # Without a cursor, we only respond if everything fits on one page. Probe for an item beyond the first
+            # page (LIMIT 1 OFFSET page_size) instead of evaluating (and then discarding) a full page.
+            self.page_size = self.get_page_size(request)
+            if self.page_size and queryset.order_by()[self.page_size :].exists():
+                self.pagination_required = True
+                return []
         return super().paginate_queryset(queryset, request, view)
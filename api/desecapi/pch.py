@@ -22,13 +22,19 @@ def _pch_request(
 ):
     if data is not None:
         data = json.dumps(data)
+        metrics.get("desecapi_pch_request_body_size").labels(method, path).observe(
+            len(data)
+        )
 
     headers = {
         "Accept": accept,
         "User-Agent": "desecapi",
         "Authorization": _config["token"],
     }
-    r = requests.request(method, _config["base_url"] + path, data=data, headers=headers)
+    with metrics.get("desecapi_pch_request_duration").labels(method, path).time():
+        r = requests.request(
+            method, _config["base_url"] + path, data=data, headers=headers
+        )
     if r.status_code not in expect_status:
         metrics.get("desecapi_pch_request_failure").labels(
             method, path, r.status_code
@@ -1,6 +1,11 @@
+import contextvars
 import json
+import random
 import re
 import socket
+import threading
+import time
+from contextlib import contextmanager
 from functools import cache
 from hashlib import sha1
 
@@ -9,7 +14,11 @@ from django.conf import settings
 from django.core.exceptions import SuspiciousOperation
 
 from desecapi import metrics
-from desecapi.exceptions import PDNSException, RequestEntityTooLarge
+from desecapi.exceptions import (
+    PDNSException,
+    PDNSUnavailable,
+    RequestEntityTooLarge,
+)
 
 SUPPORTED_RRSET_TYPES = {
     # https://doc.powerdns.com/authoritative/appendices/types.html
@@ -74,10 +83,12 @@ NSMASTER = object()
 
 _config = {
     NSLORD: {
+        "name": "nslord",
         "base_url": settings.NSLORD_PDNS_API,
         "apikey": settings.NSLORD_PDNS_API_TOKEN,
     },
     NSMASTER: {
+        "name": "nsmaster",
         "base_url": settings.NSMASTER_PDNS_API,
         "apikey": settings.NSMASTER_PDNS_API_TOKEN,
     },
@@ -89,22 +100,182 @@ def gethostbyname_cached(host):
     return socket.gethostbyname(host)
 
 
+class CircuitBreaker:
+    """
+    Tracks consecutive failures (connection errors and 502/503/504 responses, see RETRY_STATUS_CODES) of requests to
+    a pdns server. Other responses, including other 5xx ones, show that the server is up and count as successes. Once
+    PDNS_CIRCUIT_BREAKER_THRESHOLD requests in a row have failed, the circuit opens and further requests fail
+    immediately with PDNSUnavailable. After PDNS_CIRCUIT_BREAKER_TIMEOUT seconds, requests are let through again;
+    the first success closes the circuit, and another failure opens it for the next period.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+
+    def remaining(self):
+        if self.opened is None:
+            return 0
+        return max(
+            0, self.opened + settings.PDNS_CIRCUIT_BREAKER_TIMEOUT - time.monotonic()
+        )
+
+    def check(self):
+        with self.lock:
+            wait = self.remaining()
+        if wait:
+            metrics.get("desecapi_pdns_circuit_breaker_rejected").labels(
+                self.name
+            ).inc()
+            raise PDNSUnavailable(wait=wait)
+
+    def record(self, success):
+        with self.lock:
+            if success:
+                self.failures = 0
+                self.opened = None
+                return
+            self.failures += 1
+            if self.failures >= settings.PDNS_CIRCUIT_BREAKER_THRESHOLD:
+                if self.opened is None:
+                    metrics.get("desecapi_pdns_circuit_breaker_opened").labels(
+                        self.name
+                    ).inc()
+                self.opened = time.monotonic()
+
+    def reset(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+
+
+_circuit_breakers = {
+    server: CircuitBreaker(config["name"]) for server, config in _config.items()
+}
+
+# pdns responses which indicate that the server is (temporarily) unable to handle requests
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+def _path_template(path):
+    # Zone ids would make for unbounded label cardinality
+    return re.sub(r"^/zones/[^/?]+", "/zones/{id}", path).split("?")[0]
+
+
+class RetryBudget:
+    """
+    Bounds the total backoff delay before retries of pdns requests. Once it is used up, failed requests are not
+    retried anymore. Shared by the threads processing the calls of a PDNSChangeTracker.
+    """
+
+    def __init__(self, seconds):
+        self.lock = threading.Lock()
+        self.remaining = seconds
+
+    def take(self, delay):
+        with self.lock:
+            if self.remaining <= 0:
+                return None
+            delay = min(delay, self.remaining)
+            self.remaining -= delay
+            return delay
+
+
+_retry_budget = contextvars.ContextVar("retry_budget", default=None)
+
+
+@contextmanager
+def retry_budget(seconds):
+    token = _retry_budget.set(RetryBudget(seconds))
+    try:
+        yield
+    finally:
+        _retry_budget.reset(token)
+
+
+def _backoff(attempt):
+    """
+    Returns the delay before retrying after the given attempt, or None if the current retry budget is used up.
+    """
+    # Full jitter, so that concurrent clients don't retry in lockstep
+    delay = random.uniform(0, settings.PDNS_RETRY_BACKOFF * 2**attempt)
+    budget = _retry_budget.get()
+    return delay if budget is None else budget.take(delay)
+
+
+def _is_idempotent(method, data):
+    # Zone retrieval and AXFR triggers can be repeated safely, as can PATCHes that only REPLACE RRsets (this includes
+    # catalog zone removals, which REPLACE with empty records). Zone creation and deletion may have been carried out
+    # before the connection broke.
+    if method in ("get", "put"):
+        return True
+    return (
+        method == "patch"
+        and data is not None
+        and all(
+            rrset.get("changetype") == "REPLACE" for rrset in data.get("rrsets", [])
+        )
+    )
+
+
 def _pdns_request(
-    method, *, server, path, data=None, accept="application/json", **kwargs
+    method,
+    *,
+    server,
+    path,
+    data=None,
+    accept="application/json",
+    stream=False,
+    **kwargs,
 ):
+    retries = settings.PDNS_RETRIES if _is_idempotent(method, data) else 0
     if data is not None:
         data = json.dumps(data)
     if data is not None and len(data) > settings.PDNS_MAX_BODY_SIZE:
         raise RequestEntityTooLarge
 
+    labels = (_config[server]["name"], method, _path_template(path))
+    if data is not None:
+        metrics.get("desecapi_pdns_request_body_size").labels(*labels).observe(
+            len(data)
+        )
+
     headers = {
         "Accept": accept,
         "User-Agent": "desecapi",
         "X-API-Key": _config[server]["apikey"],
     }
-    r = requests.request(
-        method, _config[server]["base_url"] + path, data=data, headers=headers
-    )
+    circuit_breaker = _circuit_breakers[server]
+    for attempt in range(retries + 1):
+        circuit_breaker.check()
+        try:
+            # For streamed responses, this is the time until the headers have been received
+            with metrics.get("desecapi_pdns_request_duration").labels(*labels).time():
+                r = requests.request(
+                    method,
+                    _config[server]["base_url"] + path,
+                    data=data,
+                    headers=headers,
+                    stream=stream,
+                )
+        except (requests.ConnectionError, requests.Timeout):
+            circuit_breaker.record(success=False)
+            if attempt == retries or (delay := _backoff(attempt)) is None:
+                raise
+            reason = "connection"
+        else:
+            circuit_breaker.record(success=r.status_code not in RETRY_STATUS_CODES)
+            if r.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                break
+            if (delay := _backoff(attempt)) is None:
+                break
+            reason = r.status_code
+            r.close()  # release the connection of a discarded (streamed) response
+        metrics.get("desecapi_pdns_request_retry").labels(method, reason).inc()
+        time.sleep(delay)
+
     if r.status_code not in range(200, 300):
         metrics.get("desecapi_pdns_request_failure").labels(
             method, path, r.status_code
@@ -175,11 +346,32 @@ def get_zonefile(domain) -> bin:
     """
     Retrieves the zonefile (presentation format) of a given zone as binary string
     """
+    return b"".join(iter_zonefile(domain))
+
+
+def iter_zonefile(domain, chunk_size=64 * 1024):
+    """
+    Retrieves the zonefile (presentation format) of a given zone as a generator of binary chunks, without reading the
+    whole export into memory. Errors are raised on call, not during iteration. The connection is released when the
+    generator is exhausted or closed.
+    """
     r = _pdns_get(
-        NSLORD, "/zones/" + pdns_id(domain.name) + "/export", accept="text/dns"
+        NSLORD,
+        "/zones/" + pdns_id(domain.name) + "/export",
+        accept="text/dns",
+        stream=True,
     )
 
-    return r.content
+    def chunks():
+        try:
+            yield  # primed below, so that closing also releases the connection before iteration started
+            yield from r.iter_content(chunk_size)
+        finally:
+            r.close()
+
+    generator = chunks()
+    next(generator)
+    return generator
 
 
 def get_rrset_datas(domain):
@@ -198,14 +390,20 @@ def get_rrset_datas(domain):
     ]
 
 
-def update_catalog(zone, delete=False):
+def update_catalog(additions=(), deletions=()):
     """
-    Updates the catalog zone information (`settings.CATALOG_ZONE`) for the given zone.
+    Updates the catalog zone information (`settings.CATALOG_ZONE`) for the given added and deleted zones, using a
+    single request.
     """
+    rrsets = [construct_catalog_rrset(zone=zone) for zone in additions] + [
+        construct_catalog_rrset(zone=zone, delete=True) for zone in deletions
+    ]
+    if not rrsets:
+        return None
     content = _pdns_patch(
         NSMASTER,
         "/zones/" + pdns_id(settings.CATALOG_ZONE),
-        {"rrsets": [construct_catalog_rrset(zone=zone, delete=delete)]},
+        {"rrsets": rrsets},
     )
     metrics.get("desecapi_pdns_catalog_updated").inc()
     return content
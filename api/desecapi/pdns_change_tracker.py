@@ -1,9 +1,14 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
 from django.db.models.signals import post_save, post_delete
 from django.db.transaction import atomic
 from django.utils import timezone
 
-from desecapi import pch, pdns
+from desecapi import metrics, pch, pdns
+from desecapi.exceptions import PDNSException, PDNSUnavailable
 from desecapi.models import RRset, RR, Domain
 
 
@@ -53,6 +58,13 @@ class PDNSChangeTracker:
         def axfr_required(self):
             raise NotImplementedError()
 
+        def prepare(self):
+            """
+            Reads from the database what is needed for pdns_do(). Called in the tracker's thread (inside its database
+            transaction) before pdns_do(), which may run in another thread.
+            """
+            pass
+
         def pdns_do(self):
             raise NotImplementedError()
 
@@ -70,7 +82,7 @@ class PDNSChangeTracker:
         def pdns_do(self):
             pdns.create_zone_lord(self.domain_name)
             pdns.create_zone_master(self.domain_name)
-            pdns.update_catalog(self.domain_name)
+            # catalog zone is updated by UpdateMemberships
 
         def api_do(self):
             rr_set = RRset(
@@ -85,7 +97,7 @@ class PDNSChangeTracker:
             RR.objects.bulk_create(rrs)  # One INSERT
 
         def pch_do(self):
-            pch.create_domains([self.domain_name])
+            pass  # done by UpdateMemberships
 
         def __str__(self):
             return "Create Domain %s" % self.domain_name
@@ -96,15 +108,22 @@ class PDNSChangeTracker:
             return False
 
         def pdns_do(self):
-            pdns.delete_zone_lord(self.domain_name)
-            pdns.delete_zone_master(self.domain_name)
-            pdns.update_catalog(self.domain_name, delete=True)
+            # A 404 means the zone is already gone, e.g. when a previous (batch) deletion failed after deleting it in
+            # pdns and the database transaction was rolled back
+            for delete_zone in (pdns.delete_zone_lord, pdns.delete_zone_master):
+                try:
+                    delete_zone(self.domain_name)
+                except PDNSException as e:
+                    if e.response.status_code != 404:
+                        raise
+            Domain.invalidate_zonefile_cache(self.domain_name)
+            # catalog zone is updated by UpdateMemberships
 
         def api_do(self):
             pass
 
         def pch_do(self):
-            pch.delete_domains([self.domain_name])
+            pass  # done by UpdateMemberships
 
         def __str__(self):
             return "Delete Domain %s" % self.domain_name
@@ -115,13 +134,14 @@ class PDNSChangeTracker:
             self._additions = additions
             self._modifications = modifications
             self._deletions = deletions
+            self._data = None
 
         @property
         def axfr_required(self):
             return True
 
-        def pdns_do(self):
-            data = {
+        def prepare(self):
+            self._data = {
                 "rrsets": [
                     {
                         "name": RRset.construct_name(subname, self._domain_name),
@@ -154,8 +174,12 @@ class PDNSChangeTracker:
                 ]
             }
 
-            if data["rrsets"]:
-                pdns.update_zone(self.domain_name, data)
+        def pdns_do(self):
+            if self._data is None:
+                self.prepare()
+            if self._data["rrsets"]:
+                pdns.update_zone(self.domain_name, self._data)
+                Domain.invalidate_zonefile_cache(self.domain_name)
 
         def api_do(self):
             pass
@@ -174,6 +198,47 @@ class PDNSChangeTracker:
                 )
             )
 
+    class UpdateMemberships(PDNSChange):
+        """
+        Adds created and removes deleted domains from the catalog zone and from PCH. Domains of all given changes are
+        handled together, with one request per API.
+        """
+
+        def __init__(self, changes):
+            super().__init__(None)
+            self._additions = [
+                change.domain_name
+                for change in changes
+                if isinstance(change, PDNSChangeTracker.CreateDomain)
+            ]
+            self._deletions = [
+                change.domain_name
+                for change in changes
+                if isinstance(change, PDNSChangeTracker.DeleteDomain)
+            ]
+
+        @property
+        def axfr_required(self):
+            return False
+
+        def pdns_do(self):
+            pdns.update_catalog(self._additions, self._deletions)
+
+        def api_do(self):
+            pass
+
+        def pch_do(self):
+            if self._additions:
+                pch.create_domains(self._additions)
+            if self._deletions:
+                pch.delete_domains(self._deletions)
+
+        def __str__(self):
+            return "Update memberships: additions=%s, deletions=%s" % (
+                self._additions,
+                self._deletions,
+            )
+
     def __init__(self):
         self._domain_additions = set()
         self._domain_deletions = set()
@@ -237,29 +302,95 @@ class PDNSChangeTracker:
             self.transaction.__exit__(exc_type, exc_val, exc_tb)
             return
 
+        phase = metrics.get("desecapi_pdns_change_tracker_phase_duration").labels
+
         # TODO introduce two phase commit protocol
-        changes = self._compute_changes()
-        axfr_required = set()
-        for change in changes:
-            try:
-                change.pdns_do()
-                change.api_do()
-                if settings.PCH_API and not settings.DEBUG:
-                    change.pch_do()
-                if change.axfr_required:
-                    axfr_required.add(change.domain_name)
-            except Exception as e:
-                self.transaction.__exit__(type(e), e, e.__traceback__)
-                exc = ValueError(
-                    f"For changes {list(map(str, changes))}, {type(e)} occurred during {change}: {str(e)}"
-                )
-                raise exc from e
+        with phase("compute").time():
+            changes = self._compute_changes()
+            memberships = self.UpdateMemberships(changes)
+        change = None
+        try:
+            # Database locks are held while retrying failed pdns requests, so the total backoff is bounded
+            with pdns.retry_budget(settings.PDNS_CHANGE_TRACKER_RETRY_BUDGET):
+                with phase("pdns_do").time():
+                    for change in changes:
+                        change.prepare()
+                    # Changes of different zones are sent to pdns concurrently
+                    change, e = self._call_per_zone(
+                        lambda change: change.pdns_do(),
+                        changes,
+                        zone=lambda change: change.domain_name,
+                    )
+                if e is not None:
+                    raise e
+                with phase("api_do").time():
+                    for change in changes + [memberships]:
+                        if change is memberships:
+                            change.pdns_do()
+                        change.api_do()
+                        if settings.PCH_API and not settings.DEBUG:
+                            change.pch_do()
+        except Exception as e:
+            self.transaction.__exit__(type(e), e, e.__traceback__)
+            if isinstance(e, PDNSUnavailable):
+                raise  # pdns is down, let the client retry later (503 with Retry-After)
+            exc = ValueError(
+                f"For changes {list(map(str, changes))}, {type(e)} occurred during {change}: {str(e)}"
+            )
+            raise exc from e
+
+        with phase("commit").time():
+            self.transaction.__exit__(None, None, None)
 
-        self.transaction.__exit__(None, None, None)
+        with phase("axfr").time():
+            axfr_required = list(
+                dict.fromkeys(
+                    change.domain_name for change in changes if change.axfr_required
+                )
+            )
+            _, e = self._call_per_zone(pdns.axfr_to_master, axfr_required, zone=str)
+            if e is not None:
+                raise e
+            Domain.objects.filter(name__in=axfr_required).update(
+                published=timezone.now()
+            )
 
-        for name in axfr_required:
-            pdns.axfr_to_master(name)
-        Domain.objects.filter(name__in=axfr_required).update(published=timezone.now())
+    @staticmethod
+    def _call_per_zone(func, items, *, zone):
+        """
+        Calls func(item) for all items. Items of different zones (as given by zone(item)) are processed concurrently
+        with at most settings.PDNS_CHANGE_TRACKER_WORKERS threads, and items of the same zone in the given order.
+        Once a call fails, no further calls are started. Returns the first failed item and its exception, or
+        (None, None).
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(zone(item), []).append(item)
+        failed = threading.Event()
+
+        def process(group):
+            for item in group:
+                if failed.is_set():
+                    break
+                try:
+                    func(item)
+                except Exception as e:
+                    failed.set()
+                    return item, e
+            return None, None
+
+        workers = min(len(groups), settings.PDNS_CHANGE_TRACKER_WORKERS)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Each thread runs in a copy of the current context, e.g. to share the pdns retry budget
+                futures = [
+                    executor.submit(contextvars.copy_context().run, process, group)
+                    for group in groups.values()
+                ]
+                results = [future.result() for future in futures]
+        else:
+            results = map(process, groups.values())
+        return next(((item, e) for item, e in results if e is not None), (None, None))
 
     def _compute_changes(self):
         changes = []
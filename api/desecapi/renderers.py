@@ -24,3 +24,22 @@ class PlainTextRenderer(renderers.BaseRenderer):
                 return yaml.safe_dump(data, default_flow_style=False)
 
         return data
+
+
+class NDJSONRenderer(renderers.JSONRenderer):
+    """
+    Renders newline-delimited JSON (one JSON document per line). Views that support
+    this format usually stream their list responses item by item; anything that reaches
+    this renderer (e.g. an error or a single object) is rendered in one go.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            return b"".join(self.render_line(item) for item in data)
+        return self.render_line(data)
+
+    def render_line(self, item):
+        return super().render(item) + b"\n"
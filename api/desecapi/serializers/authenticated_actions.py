@@ -119,6 +119,10 @@ class AuthenticatedBasicUserActionMixin:
         context = {**self.context, "action_serializer": self}
         return self.action_user.send_email(self.reason, context=context, **kwargs)
 
+    def build_email(self, **kwargs):
+        context = {**self.context, "action_serializer": self}
+        return self.action_user.build_email(self.reason, context=context, **kwargs)
+
 
 class AuthenticatedBasicUserActionSerializer(
     AuthenticatedBasicUserActionMixin, AuthenticatedActionSerializer
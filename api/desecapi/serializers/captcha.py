@@ -1,7 +1,5 @@
 from base64 import b64encode
 
-from captcha.audio import AudioCaptcha
-from captcha.image import ImageCaptcha
 from django.conf import settings
 from rest_framework import serializers
 
@@ -19,20 +17,18 @@ class CaptchaSerializer(serializers.ModelSerializer):
             else ("id", "challenge", "kind", "content")
         )
 
+    def create(self, validated_data):
+        return Captcha.claim(**validated_data)
+
     def get_challenge(self, obj: Captcha):
-        # TODO Does this need to be stored in the object instance, in case this method gets called twice?
-        if obj.kind == Captcha.Kind.IMAGE:
-            challenge = ImageCaptcha().generate(obj.content).getvalue()
-        elif obj.kind == Captcha.Kind.AUDIO:
-            challenge = AudioCaptcha().generate(obj.content)
-        else:
-            raise ValueError(f"Unknown captcha type {obj.kind}")
-        return b64encode(challenge)
+        if obj.challenge is None:
+            obj.challenge = obj.generate_challenge()
+        return b64encode(obj.challenge)
 
 
 class CaptchaSolutionSerializer(serializers.Serializer):
     id = serializers.PrimaryKeyRelatedField(
-        queryset=Captcha.objects.all(),
+        queryset=Captcha.objects.filter(challenge__isnull=True),  # exclude pool
         error_messages={"does_not_exist": "CAPTCHA does not exist."},
     )
     solution = serializers.CharField(write_only=True, required=True)
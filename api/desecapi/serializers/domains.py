@@ -1,19 +1,156 @@
+import io
+import itertools
+
 import dns.name
-import dns.zone
+import dns.node
+import dns.rdataclass
+import dns.tokenizer
+import dns.transaction
+import dns.zonefile
 from django.conf import settings
 from rest_framework import serializers
 
-from desecapi.models import Domain, RR_SET_TYPES_AUTOMATIC
+from desecapi.models import Domain, RR_SET_TYPES_AUTOMATIC, ZonefileImportJob
 from desecapi.validators import ReadOnlyOnUpdateValidator
 
 from .records import RRsetSerializer
 
 
+class NonContiguousRRset(Exception):
+    pass
+
+
+class _RRsetGroupingTransaction(dns.transaction.Transaction):
+    """
+    Groups the records read by dns.zonefile.Reader into RRsets. When contiguous is True, an RRset is complete once a
+    record of another RRset is read, and only hashes of the RRsets read so far are kept. Hash collisions may cause a
+    spurious NonContiguousRRset, but never wrong results. Otherwise, RRsets are only complete at the end of the file.
+    """
+
+    def __init__(self, manager, contiguous=True):
+        super().__init__(manager)
+        self.contiguous = contiguous
+        # (name, rdtype, covers) -> rdataset for RRsets still being read
+        self.rdatasets = {}
+        self.complete = []
+        self.seen = set()
+        # name (or its hash) -> kind of non-neutral RRsets, to check CNAME exclusivity
+        self.kinds = {}
+
+    def pop_complete(self, flush=False):
+        if flush:
+            self.complete.extend(self.rdatasets.items())
+            self.rdatasets.clear()
+        complete, self.complete = self.complete, []
+        return [(name, rdataset) for (name, _, _), rdataset in complete]
+
+    def _get_rdataset(self, name, rdtype, covers):
+        return None  # merging is done in _put_rdataset, without copying the RRset for each record
+
+    def _put_rdataset(self, name, rdataset):
+        key = (name, rdataset.rdtype, rdataset.covers)
+        if (existing := self.rdatasets.get(key)) is not None:
+            existing.update(rdataset)
+            return
+        if self.contiguous:
+            # dns.name.Name's hash collides often, so we hash the (lowercase) labels
+            labels = name.canonicalize().labels
+            if hash((labels, *key[1:])) in self.seen:
+                raise NonContiguousRRset
+            self.seen.add(hash((labels, *key[1:])))
+            self.complete.extend(self.rdatasets.items())
+            self.rdatasets.clear()
+        kind = dns.node.NodeKind.classify_rdataset(rdataset)
+        if kind != dns.node.NodeKind.NEUTRAL:
+            name_key = hash(labels) if self.contiguous else name
+            if self.kinds.setdefault(name_key, kind) != kind:
+                # in contiguous mode, this may be a hash collision, so we check again with the names
+                raise (
+                    NonContiguousRRset
+                    if self.contiguous
+                    else dns.zonefile.CNAMEAndOtherData
+                )
+        self.rdatasets[key] = rdataset
+
+    def _get_node(self, name):
+        return None  # CNAME exclusivity is checked in _put_rdataset
+
+    def _set_origin(self, origin):
+        pass
+
+    # dns.zonefile.Reader only adds records. The remaining hooks would need the full zone, which is never kept, so
+    # they fail explicitly (instead of silently misbehaving) should a dnspython upgrade start to use them.
+    def _unsupported(self, *args, **kwargs):
+        raise NotImplementedError(
+            f"{type(self).__name__} only supports adding records from a zone file"
+        )
+
+    def _delete_name(self, name):
+        self._unsupported()
+
+    def _delete_rdataset(self, name, rdtype, covers):
+        self._unsupported()
+
+    def _name_exists(self, name):
+        self._unsupported()
+
+    def _changed(self):
+        self._unsupported()
+
+    def _end_transaction(self, commit):
+        self._unsupported()
+
+    def _iterate_rdatasets(self):
+        self._unsupported()
+
+    def _iterate_names(self):
+        self._unsupported()
+
+
+def _zonefile_segments(zonefile: str, lines=100):
+    """
+    Yields (first line number, text) pairs of about the given number of lines, without splitting records which span
+    several lines using parentheses.
+    """
+    segment, start, depth = [], 1, 0
+    for line_number, line in enumerate(io.StringIO(zonefile), 1):
+        segment.append(line)
+        if depth or "(" in line or ")" in line:
+            depth = _parenthesis_depth(line, depth)
+        if len(segment) >= lines and depth <= 0:
+            yield start, "".join(segment)
+            segment, start, depth = [], line_number + 1, 0
+    if segment:
+        yield start, "".join(segment)
+
+
+def _parenthesis_depth(line: str, depth: int):
+    quoted = escaped = False
+    for c in line:
+        if escaped:
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif quoted:
+            quoted = c != '"'
+        elif c == '"':
+            quoted = True
+        elif c == ";":
+            break  # comment
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+    return depth
+
+
 class DomainSerializer(serializers.ModelSerializer):
     default_error_messages = {
         **serializers.Serializer.default_error_messages,
         "name_unavailable": "This domain name conflicts with an existing domain, or is disallowed by policy.",
     }
+    # number of RRsets validated and saved at once during zone file import
+    import_chunk_size = 1000
     zonefile = serializers.CharField(write_only=True, required=False, allow_blank=True)
 
     class Meta:
@@ -35,9 +172,12 @@ class DomainSerializer(serializers.ModelSerializer):
             "name": {"trim_whitespace": False},
         }
 
-    def __init__(self, *args, include_keys=False, **kwargs):
+    def __init__(self, *args, include_keys=False, import_async=False, **kwargs):
         self.include_keys = include_keys
-        self.import_zone = None
+        self.import_async = import_async
+        self.import_zonefile = None
+        self.import_contiguous = None
+        self.import_job = None
         super().__init__(*args, **kwargs)
 
     def get_fields(self):
@@ -54,15 +194,26 @@ class DomainSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def parse_zonefile(self, domain_name: str, zonefile: str):
+    @staticmethod
+    def parse_zonefile(domain_name: str, zonefile: str, contiguous=True):
+        """
+        Yields (owner name, rdataset) pairs from a zone file. The file is read in segments of complete lines, and
+        RRsets are yielded as soon as a record of another RRset follows, so that only the current segment and RRset
+        are kept in memory. If contiguous is False, RRsets are only yielded after reading the whole file, which is
+        needed when the records of an RRset are spread across the file (otherwise NonContiguousRRset is raised).
+        """
+        txn = _RRsetGroupingTransaction(
+            dns.zonefile.RRSetsReaderManager(origin=dns.name.from_text(domain_name)),
+            contiguous=contiguous,
+        )
+        reader = dns.zonefile.Reader(None, dns.rdataclass.IN, txn, allow_include=False)
         try:
-            self.import_zone = dns.zone.from_text(
-                zonefile,
-                origin=dns.name.from_text(domain_name),
-                allow_include=False,
-                check_origin=False,
-                relativize=False,
-            )
+            for line_number, segment in _zonefile_segments(zonefile):
+                reader.tok = dns.tokenizer.Tokenizer(segment)
+                reader.tok.line_number = line_number  # for error messages
+                reader.read()
+                yield from txn.pop_complete()
+            yield from txn.pop_complete(flush=True)
         except dns.zonefile.CNAMEAndOtherData:
             raise serializers.ValidationError(
                 {
@@ -92,52 +243,81 @@ class DomainSerializer(serializers.ModelSerializer):
                     {"zonefile": [f"Could not parse zonefile: {str(e)}"]}
                 )
 
-    def validate(self, attrs):
-        if attrs.get("zonefile") is not None:
-            self.parse_zonefile(attrs.get("name"), attrs.pop("zonefile"))
-        return super().validate(attrs)
+    @classmethod
+    def zonefile_rrset_datas(cls, domain: Domain, zonefile: str, contiguous=True):
+        """
+        Yields RRset data for RRsetSerializer from a zone file, skipping RRsets which are not to be imported.
+        """
+        zone_name = dns.name.from_text(domain.name)
+        min_ttl, max_ttl = domain.minimum_ttl, settings.MAXIMUM_TTL
+        skip_types = RR_SET_TYPES_AUTOMATIC | {  # automatically managed record types
+            "CDS",
+            "CDNSKEY",
+            "DNSKEY",
+        }  # do not import these, as this would likely be unexpected
+        for owner_name, rrset in cls.parse_zonefile(domain.name, zonefile, contiguous):
+            if dns.rdatatype.to_text(rrset.rdtype) in skip_types:
+                continue
+            if (
+                owner_name - zone_name == dns.name.empty
+                and rrset.rdtype == dns.rdatatype.NS
+            ):
+                continue  # ignore apex NS
+            yield {
+                "type": dns.rdatatype.to_text(rrset.rdtype),
+                "ttl": max(min_ttl, min(max_ttl, rrset.ttl)),
+                "subname": (
+                    (owner_name - zone_name).to_text()
+                    if owner_name - zone_name != dns.name.empty
+                    else ""
+                ),
+                "records": [rr.to_text() for rr in rrset],
+            }
 
-    def create(self, validated_data):
-        # save domain
-        domain: Domain = super().create(validated_data)
+    @classmethod
+    def check_zonefile(cls, domain_name: str, zonefile: str):
+        """
+        Parses the zone file without keeping its contents, raising ValidationError if it cannot be parsed. Returns
+        whether the records of each RRset are contiguous in the file.
+        """
+        try:
+            for _ in cls.parse_zonefile(domain_name, zonefile):
+                pass
+            return True
+        except NonContiguousRRset:
+            for _ in cls.parse_zonefile(domain_name, zonefile, contiguous=False):
+                pass
+            return False
 
-        # save RRsets if zonefile was given
-        nodes = getattr(self.import_zone, "nodes", None)
-        if nodes:
-            zone_name = dns.name.from_text(validated_data["name"])
-            min_ttl, max_ttl = domain.minimum_ttl, settings.MAXIMUM_TTL
-            data = [
-                {
-                    "type": dns.rdatatype.to_text(rrset.rdtype),
-                    "ttl": max(min_ttl, min(max_ttl, rrset.ttl)),
-                    "subname": (
-                        (owner_name - zone_name).to_text()
-                        if owner_name - zone_name != dns.name.empty
-                        else ""
-                    ),
-                    "records": [rr.to_text() for rr in rrset],
-                }
-                for owner_name, node in nodes.items()
-                for rrset in node.rdatasets
-                if (
-                    dns.rdatatype.to_text(rrset.rdtype)
-                    not in (
-                        RR_SET_TYPES_AUTOMATIC
-                        | {  # do not import automatically managed record types
-                            "CDS",
-                            "CDNSKEY",
-                            "DNSKEY",
-                        }  # do not import these, as this would likely be unexpected
-                    )
-                    and not (
-                        owner_name - zone_name == dns.name.empty
-                        and rrset.rdtype == dns.rdatatype.NS
-                    )  # ignore apex NS
-                )
-            ]
+    @classmethod
+    def import_zonefile_rrsets(
+        cls, domain: Domain, zonefile: str, context, chunk_size=None, contiguous=None
+    ):
+        """
+        Imports the RRsets from the zone file into the domain while reading it, see import_rrsets(). The zone file is
+        checked first, unless the result of check_zonefile() is passed as `contiguous`. Returns the number of imported
+        RRsets.
+        """
+        if contiguous is None:
+            contiguous = cls.check_zonefile(domain.name, zonefile)
+        return cls.import_rrsets(
+            domain,
+            cls.zonefile_rrset_datas(domain, zonefile, contiguous),
+            context,
+            chunk_size,
+        )
 
+    @staticmethod
+    def import_rrsets(domain: Domain, datas, context, chunk_size=None):
+        """
+        Validates and saves the given RRset data in chunks of `chunk_size` RRsets (all at once if None). Returns the
+        number of imported RRsets. Raises ValidationError with messages under the `zonefile` key.
+        """
+        datas = iter(datas)
+        count = 0
+        while data := list(itertools.islice(datas, chunk_size)):
             rrset_list_serializer = RRsetSerializer(
-                data=data, context=dict(self.context, domain=domain), many=True
+                data=data, context=dict(context, domain=domain), many=True
             )
             # The following line raises if data passed validation by dnspython during zone file parsing,
             # but is rejected by validation in RRsetSerializer. See also
@@ -165,5 +345,54 @@ class DomainSerializer(serializers.ModelSerializer):
                 raise e
 
             rrset_list_serializer.save()
+            count += len(data)
+        return count
+
+    def validate(self, attrs):
+        self.import_zonefile = attrs.pop("zonefile", None)
+        if self.import_zonefile and not self.import_async:
+            # raise parsing errors before creating the domain; async imports are checked by the import job
+            self.import_contiguous = self.check_zonefile(
+                attrs.get("name"), self.import_zonefile
+            )
+        return super().validate(attrs)
+
+    def create(self, validated_data):
+        # save domain
+        domain: Domain = super().create(validated_data)
+
+        # save RRsets if zonefile was given, or schedule their import
+        if self.import_zonefile and self.import_async:
+            self.import_job = ZonefileImportJob.objects.create(
+                domain=domain,
+                token=self.context["request"].auth,
+                zonefile=self.import_zonefile,
+            )
+        elif self.import_zonefile:
+            self.import_zonefile_rrsets(
+                domain,
+                self.import_zonefile,
+                self.context,
+                chunk_size=self.import_chunk_size,
+                contiguous=self.import_contiguous,
+            )
 
         return domain
+
+
+class ZonefileImportJobSerializer(serializers.ModelSerializer):
+    domain = serializers.SlugRelatedField(slug_field="name", read_only=True)
+
+    class Meta:
+        model = ZonefileImportJob
+        fields = (
+            "id",
+            "domain",
+            "status",
+            "created",
+            "started",
+            "finished",
+            "rrsets",
+            "errors",
+        )
+        read_only_fields = fields
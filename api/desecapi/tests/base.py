@@ -17,6 +17,7 @@ from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.utils import json
 
+from desecapi import pdns
 from desecapi.models import User, Domain, Token, RRset, RR
 from desecapi.models.domains import psl
 from desecapi.models.records import (
@@ -699,6 +700,8 @@ class MockPDNSTestCase(APITestCase):
         super().setUp()
         self.responses = responses.RequestsMock(assert_all_requests_are_fired=False)
         self.responses.start()
+        for circuit_breaker in pdns._circuit_breakers.values():
+            circuit_breaker.reset()
         for request in [
             # TODO delete not in this list - is this even needed?
             self.request_pdns_zone_create(ns="LORD"),
@@ -903,11 +906,18 @@ class DesecTestCase(MockPDNSTestCase):
             )
         return parents[0]
 
-    def requests_desec_domain_creation(self, name=None, axfr=True, keys=True):
+    def requests_desec_domain_creation(
+        self, name=None, axfr=True, keys=True, rr_sets=False
+    ):
         soa_content = "get.desec.io. get.desec.io. 1 86400 3600 2419200 3600"
         requests = [
             self.request_pdns_zone_create("LORD", body_matcher(soa_content)),
             self.request_pdns_zone_create(ns="MASTER"),
+        ]
+        if rr_sets:
+            # RRsets are written before catalog and PCH are updated for all domains at once
+            requests.append(self.request_pdns_zone_update(name=name))
+        requests += [
             self.request_pdns_update_catalog(),
             self.request_pch_zone_create(name=name),
         ]
@@ -917,13 +927,16 @@ class DesecTestCase(MockPDNSTestCase):
             requests.append(self.request_pdns_zone_retrieve_crypto_keys(name=name))
         return requests
 
-    def requests_desec_domain_deletion(self, domain):
+    def requests_desec_domain_deletion(self, domain, memberships=True):
         requests = [
             self.request_pdns_zone_delete(name=domain.name, ns="LORD"),
             self.request_pdns_zone_delete(name=domain.name, ns="MASTER"),
-            self.request_pdns_update_catalog(),
-            self.request_pch_zone_delete(name=domain.name),
         ]
+        if memberships:
+            requests += [
+                self.request_pdns_update_catalog(),
+                self.request_pch_zone_delete(name=domain.name),
+            ]
 
         if domain.is_locally_registrable:
             delegate_at = self._find_auto_delegation_zone(domain.name)
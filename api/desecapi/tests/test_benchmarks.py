@@ -0,0 +1,30 @@
+from django.test import TestCase
+
+from desecapi.benchmarks.harness import Benchmark, compare
+
+
+class BenchmarkTestCase(TestCase):
+    def test_run(self):
+        with Benchmark(repeat=2) as bench:
+            for name in ["domain_create", "rrsets_bulk_patch_10", "dyndns_update"]:
+                result = bench.run(name)
+                self.assertGreater(result["latency_ms"]["median"], 0)
+                self.assertGreater(result["queries"], 0)
+                self.assertGreater(result["pdns_requests"], 0)
+            # One AXFR per request (1 warmup + 2 repetitions per scenario) and per domain created during setup
+            self.assertEqual(bench.standin.requests["nsmaster", "PUT"], 3 * 3 + 2)
+
+    def test_compare(self):
+        baseline = {
+            "a": {"latency_ms": {"median": 10}, "queries": 5, "pdns_requests": 2},
+            "b": {"latency_ms": {"median": 10}, "queries": 5, "pdns_requests": 2},
+        }
+        results = {
+            "a": {"latency_ms": {"median": 14}, "queries": 4, "pdns_requests": 2},
+            "b": {"latency_ms": {"median": 16}, "queries": 6, "pdns_requests": 2},
+            "c": {"latency_ms": {"median": 99}, "queries": 99, "pdns_requests": 9},
+        }
+        self.assertEqual(
+            compare(results, baseline, tolerance=1.5),
+            ["b: queries 5 -> 6", "b: median latency 10ms -> 16ms"],
+        )
@@ -4,7 +4,8 @@ from unittest import mock
 
 from PIL import Image
 from django.conf import settings
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.reverse import reverse
@@ -90,6 +91,33 @@ class CaptchaWorkflowTestCase(DesecTestCase):
         ):
             self.assertFalse(self.verify(id, correct_solution))
 
+    def test_pool(self):
+        kind = self.kind or Captcha.Kind.IMAGE
+        with override_settings(CAPTCHA_POOL_SIZE={kind: 2}):
+            call_command("fill-captcha-pool")
+        pool = Captcha.objects.filter(kind=kind, challenge__isnull=False)
+        pooled = {str(captcha.id): bytes(captcha.challenge) for captcha in pool.all()}
+        self.assertEqual(len(pooled), 2)
+
+        # Pooled CAPTCHAs cannot be solved before they are handed out
+        captcha = pool.first()
+        self.assertFalse(self.verify(captcha.id, captcha.content))
+
+        for remaining in [1, 0]:
+            data = self.obtain().data
+            self.assertEqual(b64decode(data["challenge"]), pooled.pop(data["id"]))
+            self.assertEqual(pool.count(), remaining)
+            captcha = Captcha.objects.get(id=data["id"])
+            self.assertLess(
+                timezone.now() - captcha.created, timezone.timedelta(seconds=1)
+            )
+            self.assertTrue(self.verify(data["id"], captcha.content))
+
+        # When the pool is empty, CAPTCHAs are created on demand
+        data = self.obtain().data
+        self.assertEqual(Captcha.objects.get(id=data["id"]).challenge, None)
+        self.assertEqual(pool.count(), 0)
+
 
 class ImageCaptchaWorkflowTestCase(CaptchaWorkflowTestCase):
     kind = "image"
@@ -0,0 +1,137 @@
+import importlib
+import threading
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+import dns.exception
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from desecapi.tests.base import DesecTestCase
+
+check_secondaries = importlib.import_module(
+    "desecapi.management.commands.check-secondaries"
+)
+
+SECONDARIES = {"ns1.example": "192.0.2.1", "ns2.example": "192.0.2.2"}
+
+
+@override_settings(WATCHDOG_SECONDARIES=list(SECONDARIES))
+@mock.patch.object(check_secondaries, "gethostbyname", SECONDARIES.get)
+@mock.patch.object(check_secondaries, "mail_admins")
+class CheckSecondariesTestCase(DesecTestCase):
+    def setUp(self):
+        super().setUp()
+        self.serials = {
+            f"{self.create_domain(published=timezone.now()).name}.": serial
+            for serial in (10, 20, 30)
+        }
+        self.create_domain(published=None)  # not recently published, not checked
+
+    def check(self, query_serial, *args):
+        output = StringIO()
+        with (
+            mock.patch.object(check_secondaries.pdns, "get_serials") as get_serials,
+            mock.patch.object(
+                check_secondaries, "query_serial", side_effect=query_serial
+            ) as query_serial,
+            redirect_stdout(output),
+        ):
+            get_serials.return_value = self.serials
+            call_command("check-secondaries", "--delay=0", *args)
+        return query_serial, output.getvalue()
+
+    def test_in_sync(self, mail_admins):
+        query_serial, output = self.check(lambda zone, server: self.serials[zone])
+        self.assertEqual(
+            {call.args for call in query_serial.call_args_list},
+            {
+                (zone, server)
+                for zone in self.serials
+                for server in SECONDARIES.values()
+            },
+        )
+        self.assertIn("Checked 3 domains, 0 were outdated.", output)
+        mail_admins.assert_not_called()
+
+    def test_concurrent_probing(self, mail_admins):
+        # Only returns if all queries are in flight at the same time
+        barrier = threading.Barrier(len(self.serials) * len(SECONDARIES), timeout=10)
+
+        def query_serial(zone, server):
+            barrier.wait()
+            return self.serials[zone]
+
+        _, output = self.check(query_serial, f"--concurrency={len(self.serials)}")
+        self.assertIn("Checked 3 domains, 0 were outdated.", output)
+        mail_admins.assert_not_called()
+
+    def test_outdated(self, mail_admins):
+        outdated, missing = list(self.serials)[:2]
+
+        def query_serial(zone, server):
+            if (zone, server) == (outdated, "192.0.2.1"):
+                return self.serials[zone] - 1
+            if (zone, server) == (missing, "192.0.2.2"):
+                return None
+            return self.serials[zone]
+
+        _, output = self.check(query_serial)
+        self.assertIn("Checked 3 domains, 2 were outdated.", output)
+        subject, message = mail_admins.call_args.args
+        self.assertEqual(subject, "0 timeouts, 2 secondaries out of sync")
+        self.assertIn(f"{outdated} (10) is outdated on {{'ns1.example': 9}}", message)
+        self.assertIn(f"{missing} (20) is outdated on {{'ns2.example': None}}", message)
+
+    def test_timeouts(self, mail_admins):
+        timeout = list(self.serials)[0]
+
+        def query_serial(zone, server):
+            return False if zone == timeout else self.serials[zone]
+
+        # Timeouts alone are not reported
+        _, output = self.check(query_serial)
+        self.assertIn("Checked 3 domains, 0 were outdated.", output)
+        mail_admins.assert_not_called()
+
+        # ... but they are along with outdated secondaries
+        outdated = list(self.serials)[1]
+        _, output = self.check(
+            lambda zone, server: (
+                self.serials[zone] - 1
+                if zone == outdated
+                else query_serial(zone, server)
+            )
+        )
+        self.assertIn("Checked 3 domains, 1 were outdated.", output)
+        subject, message = mail_admins.call_args.args
+        self.assertEqual(subject, "2 timeouts, 2 secondaries out of sync")
+        self.assertIn(
+            f"{{'ns1.example': [{timeout!r}], 'ns2.example': [{timeout!r}]}}",
+            message,
+        )
+
+    def test_query_error(self, mail_admins):
+        failing = list(self.serials)[0]
+
+        def query_serial(zone, server):
+            if zone == failing and server == "192.0.2.1":
+                raise ConnectionRefusedError
+            return self.serials[zone]
+
+        # The failure is treated like a timeout, and the other zones are still checked
+        query_serial, output = self.check(query_serial)
+        self.assertEqual(query_serial.call_count, len(self.serials) * len(SECONDARIES))
+        self.assertIn(f"{failing} query to ns1.example failed", output)
+        self.assertIn("Checked 3 domains, 0 were outdated.", output)
+        mail_admins.assert_not_called()
+
+    def test_query_serial_timeout(self, mail_admins):
+        with mock.patch.object(
+            check_secondaries.dns.query, "tcp", side_effect=dns.exception.Timeout
+        ):
+            self.assertIs(
+                check_secondaries.query_serial("example.com.", "192.0.2.1"), False
+            )
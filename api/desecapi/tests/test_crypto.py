@@ -36,6 +36,13 @@ class CryptoTestCase(TestCase):
         )
         self.assertNotEqual(*keys)
 
+    def test_retrieved_key_is_cached(self):
+        crypto._derive_urlsafe_key.cache_clear()
+        for _ in range(3):
+            crypto.retrieve_key(label="test", context=self.context)
+        cache_info = crypto._derive_urlsafe_key.cache_info()
+        self.assertEqual((cache_info.misses, cache_info.hits), (1, 2))
+
     def test_encrypt_has_high_entropy(self):
         def entropy(value: str):
             result = 0
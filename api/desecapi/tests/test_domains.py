@@ -1,13 +1,24 @@
+import inspect
 from contextlib import nullcontext
+from unittest import mock
 
+import dns.transaction
+import dns.zonefile
+import requests
 from django.conf import settings
 from django.core import mail
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.test import override_settings
+from django.utils import timezone
 from rest_framework import status
 
-from desecapi.models import Domain
+from desecapi.models import Domain, ZonefileImportJob
 from desecapi.pdns_change_tracker import PDNSChangeTracker
+from desecapi.serializers import DomainSerializer
+from desecapi.serializers.domains import _RRsetGroupingTransaction
+from desecapi.serializers.records import RRsetListSerializer
 from desecapi.tests.base import (
     DesecTestCase,
     DomainOwnerTestCase,
@@ -241,6 +252,20 @@ class DomainOwnerTestCase1(DomainOwnerTestCase):
         self.assertEqual(response_set, expected_set)
         self.assertFalse(any("keys" in data for data in response.data))
 
+    def test_list_domains_query_count(self):
+        # Query count must not depend on the number of domains or RRsets
+        for _ in range(2):
+            with self.assertNumQueries(6):
+                response = self.client.get(self.reverse("v1:domain-list"))
+            self.assertStatus(response, status.HTTP_200_OK)
+            touched = {data["name"]: data["touched"] for data in response.data}
+            for domain in Domain.objects.filter(owner=self.owner):
+                self.assertEqual(touched[domain.name], domain.touched)
+
+            for _ in range(3):
+                domain = self.create_domain(owner=self.owner)
+                self.create_rr_set(domain, ["1.2.3.4"], type="A", ttl=3600)
+
     def test_list_domains_owns_qname(self):
         # Domains outside this account or non-existent
         for domain in ["non-existent.net", self.other_domain.name, "domain.invalid/"]:
@@ -366,12 +391,84 @@ class DomainOwnerTestCase1(DomainOwnerTestCase):
         ):
             response = self.client.get(url)
             self.assertStatus(response, status.HTTP_200_OK)
-            prefix, data = response.data.split(b"\n", 1)
+            prefix, data = b"".join(response.streaming_content).split(b"\n", 1)
             self.assertTrue(
                 prefix.startswith(b"; Zonefile for " + self.my_domain.name.encode())
             )
             self.assertEqual(data, b"Zone export dummy!")
 
+    def test_zonefile_my_domain_closed(self):
+        url = self.reverse("v1:domain-detail", name=self.my_domain.name) + "zonefile/"
+        for published in [None, timezone.now()]:
+            self.my_domain.published = published
+            self.my_domain.save()
+            with (
+                self.assertRequests(
+                    self.request_pdns_zone_retrieve_zone_export(
+                        name=self.my_domain.name
+                    )
+                ),
+                mock.patch.object(requests.Response, "close", autospec=True) as close,
+            ):
+                response = self.client.get(url)
+                self.assertStatus(response, status.HTTP_200_OK)
+                # Client goes away after the first chunk of the export
+                content = iter(response.streaming_content)
+                self.assertTrue(next(content).startswith(b"; Zonefile for "))
+                self.assertEqual(next(content), b"Zone export dummy!")
+                close.assert_not_called()
+                # As the server would, but keep the test's database connection (as the test client does)
+                with mock.patch.object(connection, "close_if_unusable_or_obsolete"):
+                    response.close()
+                close.assert_called_once()
+
+    @mock.patch.object(Domain, "zonefile_cache_chunk_size", 4)
+    def test_zonefile_my_domain_cached(self):
+        url = self.reverse("v1:domain-detail", name=self.my_domain.name) + "zonefile/"
+        self.my_domain.published = timezone.now()
+        self.my_domain.save()
+
+        def export(*requests):
+            with self.assertRequests(*requests):
+                response = self.client.get(url)
+                self.assertStatus(response, status.HTTP_200_OK)
+                self.assertTrue(
+                    b"".join(response.streaming_content).endswith(
+                        b"\nZone export dummy!"
+                    )
+                )
+
+        export(self.request_pdns_zone_retrieve_zone_export(name=self.my_domain.name))
+        # Repeated exports are served from the cache
+        export()
+
+        # Changing the zone invalidates the cached export
+        with self.assertRequests(
+            self.requests_desec_rr_sets_update(name=self.my_domain.name)
+        ):
+            response = self.client.post_rr_set(
+                self.my_domain.name,
+                subname="x",
+                type="A",
+                records=["1.2.3.4"],
+                ttl=3600,
+            )
+            self.assertStatus(response, status.HTTP_201_CREATED)
+        export(self.request_pdns_zone_retrieve_zone_export(name=self.my_domain.name))
+        export()
+
+        # ... also when the zone was changed on nslord, but not published (e.g. because the AXFR failed)
+        published = Domain.objects.get(pk=self.my_domain.pk).published
+        with self.assertRequests(
+            self.request_pdns_zone_update(name=self.my_domain.name)
+        ):
+            PDNSChangeTracker.CreateUpdateDeleteRRSets(
+                self.my_domain.name, set(), {("A", "x")}, set()
+            ).pdns_do()
+        self.assertEqual(Domain.objects.get(pk=self.my_domain.pk).published, published)
+        export(self.request_pdns_zone_retrieve_zone_export(name=self.my_domain.name))
+        export()
+
     def test_retrieve_other_domains(self):
         for domain in self.other_domains:
             response = self.client.get(
@@ -478,9 +575,7 @@ localhost.import-me.example A 127.0.0.1
 """
         name = "import-me.example"
         with self.assertRequests(
-            self.requests_desec_domain_creation(name, axfr=False, keys=False)
-            + self.requests_desec_rr_sets_update(name)
-            + [self.request_pdns_zone_retrieve_crypto_keys(name)]
+            self.requests_desec_domain_creation(name, rr_sets=True)
         ):
             response = self.client.post(
                 self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
@@ -523,6 +618,128 @@ localhost.import-me.example A 127.0.0.1
             domain, subname="localhost", type_="A", ttl=43200, rr_contents={"127.0.0.1"}
         )
 
+    def test_create_domain_zonefile_import_async(self):
+        zonefile = """$ORIGIN import-me.example.
+$TTL 3600
+@ NS ns1.example.com.
+@ A 10.1.1.1
+* A 10.1.1.1
+@ TXT "v=spf1 -all"
+_dmarc TXT "v=DMARC1; p=reject;"
+xxx NS ns4.example.
+"""
+        name = "import-me.example"
+        with self.assertRequests(self.requests_desec_domain_creation(name)):
+            response = self.client.post(
+                self.reverse("v1:domain-list"),
+                {"name": name, "zonefile": zonefile},
+                headers={"Prefer": "respond-async"},
+            )
+        self.assertStatus(response, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["domain"], name)
+        self.assertEqual(response.data["status"], ZonefileImportJob.Status.PENDING)
+        domain = Domain.objects.get(name=name)
+        self.assertEqual(
+            set(domain.rrset_set.values_list("type", flat=True)), {"NS"}
+        )  # only default NS so far
+
+        url = response["Location"]
+        self.assertTrue(
+            url.endswith(
+                self.reverse("v1:domain-import", name=name, job_id=response.data["id"])
+            )
+        )
+        response = self.client.get(url)
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], ZonefileImportJob.Status.PENDING)
+
+        with self.assertRequests(self.requests_desec_rr_sets_update(name)):
+            call_command("import-zonefiles", chunk_size=2)
+        response = self.client.get(url)
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], ZonefileImportJob.Status.SUCCEEDED)
+        self.assertEqual(response.data["rrsets"], 5)
+        self.assertEqual(response.data["errors"], [])
+        ttl = max(3600, settings.MINIMUM_TTL_DEFAULT)
+        self.assertRRsetDB(
+            domain, subname="*", type_="A", ttl=ttl, rr_contents={"10.1.1.1"}
+        )
+        self.assertRRsetDB(
+            domain,
+            subname="xxx",
+            type_="NS",
+            ttl=ttl,
+            rr_contents={"ns4.example."},
+        )
+        self.assertEqual(ZonefileImportJob.objects.get().zonefile, "")
+
+        # Nothing left to do
+        with self.assertRequests():
+            call_command("import-zonefiles")
+
+        # Jobs of other domains are not visible
+        url = self.reverse(
+            "v1:domain-import", name=self.my_domain.name, job_id=response.data["id"]
+        )
+        self.assertStatus(self.client.get(url), status.HTTP_404_NOT_FOUND)
+
+    def test_create_domain_zonefile_import_async_validation(self):
+        zonefile = f"""$ORIGIN .
+$TTL 43200 ; 12 hours
+import-me.example A 127.0.0.1
+import-me.example MX 10 $url.
+"""
+        name = "import-me.example"
+        with self.assertRequests(self.requests_desec_domain_creation(name)):
+            response = self.client.post(
+                self.reverse("v1:domain-list"),
+                {"name": name, "zonefile": zonefile},
+                headers={"Prefer": "respond-async"},
+            )
+        self.assertStatus(response, status.HTTP_202_ACCEPTED)
+
+        with self.assertRequests():
+            call_command("import-zonefiles")
+        job = ZonefileImportJob.objects.get()
+        self.assertEqual(job.status, ZonefileImportJob.Status.FAILED)
+        self.assertEqual(
+            job.errors,
+            [
+                "import-me.example/MX: Cannot parse record contents: invalid exchange: \\$url."
+            ],
+        )
+        self.assertEqual(
+            set(Domain.objects.get(name=name).rrset_set.values_list("type", flat=True)),
+            {"NS"},
+        )
+
+    def test_create_domain_zonefile_import_async_conflict(self):
+        name = "import-me.example"
+        with self.assertRequests(self.requests_desec_domain_creation(name)):
+            response = self.client.post(
+                self.reverse("v1:domain-list"),
+                {"name": name, "zonefile": "$TTL 3600\nwww A 127.0.0.1\n"},
+                headers={"Prefer": "respond-async"},
+            )
+        self.assertStatus(response, status.HTTP_202_ACCEPTED)
+
+        # The user creates the same RRset while the import is being processed
+        with (
+            self.assertRequests(),
+            mock.patch.object(
+                RRsetListSerializer, "save", side_effect=IntegrityError("duplicate")
+            ),
+        ):
+            call_command("import-zonefiles")
+        job = ZonefileImportJob.objects.get()
+        self.assertEqual(job.status, ZonefileImportJob.Status.FAILED)
+        self.assertEqual(
+            job.errors,
+            [
+                "Zonefile import conflicts with changes made to the domain in the meantime."
+            ],
+        )
+
     def test_create_domain_zonefile_import_cname_exclusivity(self):
         zonefile = """$ORIGIN .
 $TTL 43200 ; 12 hours
@@ -585,6 +802,115 @@ www.import-me.example A asdf
             {"zonefile": [f"Zonefile contains syntax error in line 6."]},
         )
 
+    def test_create_domain_zonefile_import_segments(self):
+        # records spanning several lines (e.g. the SOA record) must not be split across parsing segments
+        lines = [f"a{i} A 127.0.0.{i % 256}" for i in range(97)] + [
+            "@ SOA ns1.example.com. hostmaster.example.com. (",
+            "  2022021300 ; serial",
+            "  10800 3600 2419000 43200 )",
+        ]
+        lines += [f"b{i} A 127.0.0.{i % 256}" for i in range(100)]
+        zonefile = "$TTL 3600\n" + "\n".join(lines)  # names relative to the domain
+        name = "import-me.example"
+        with self.assertRequests(
+            self.requests_desec_domain_creation(name, rr_sets=True)
+        ):
+            response = self.client.post(
+                self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
+            )
+        self.assertResponse(response, status.HTTP_201_CREATED)
+        self.assertEqual(Domain.objects.get(name=name).rrset_set.count(), 198)
+
+        response = self.client.post(
+            self.reverse("v1:domain-list"),
+            {"name": "import-me2.example", "zonefile": zonefile + "\nc A asdf\n"},
+        )
+        self.assertResponse(response, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {"zonefile": ["Zonefile contains syntax error in line 202."]},
+        )
+
+    def test_zonefile_reader_contract(self):
+        # Zone files are parsed with private parts of dnspython's Reader/Transaction interface. Fail loudly if that
+        # interface changes with an upgrade, instead of silently mis-parsing zone files.
+        hooks = {
+            name
+            for name, attr in vars(dns.transaction.Transaction).items()
+            if inspect.isfunction(attr)
+            and "raise NotImplementedError" in inspect.getsource(attr)
+        }
+        self.assertEqual(
+            hooks,
+            {
+                "_get_rdataset",
+                "_put_rdataset",
+                "_delete_name",
+                "_delete_rdataset",
+                "_name_exists",
+                "_changed",
+                "_end_transaction",
+                "_set_origin",
+                "_iterate_rdatasets",
+                "_iterate_names",
+                "_get_node",
+            },
+        )
+        for name in hooks:
+            self.assertIn(name, vars(_RRsetGroupingTransaction))
+        self.assertEqual(
+            list(inspect.signature(dns.zonefile.Reader).parameters)[:4],
+            ["tok", "rdclass", "txn", "allow_include"],
+        )
+
+        # The tokenizer is replaced between segments, and records are added through the transaction only
+        zonefile = "\n".join(f"a{i // 2} 3600 A 127.0.0.{i}" for i in range(250))
+        rrsets = list(DomainSerializer.parse_zonefile("example.", zonefile))
+        self.assertEqual(len(rrsets), 125)
+        self.assertTrue(all(len(rdataset) == 2 for _, rdataset in rrsets))
+
+    def test_create_domain_zonefile_import_non_contiguous(self):
+        zonefile = """$ORIGIN import-me.example.
+$TTL 3600
+@ A 127.0.0.1
+www A 127.0.0.3
+@ MX 10 example.com.
+@ A 127.0.0.2
+www CNAME a.example.
+"""
+        name = "import-me.example"
+        response = self.client.post(
+            self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
+        )
+        self.assertResponse(response, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                "zonefile": [
+                    "No other records with the same name are allowed alongside a CNAME record."
+                ]
+            },
+        )
+
+        zonefile = zonefile.replace("www CNAME a.example.", "www A 127.0.0.4")
+        with self.assertRequests(
+            self.requests_desec_domain_creation(name, rr_sets=True)
+        ):
+            response = self.client.post(
+                self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
+            )
+        self.assertResponse(response, status.HTTP_201_CREATED)
+        domain = Domain.objects.get(name=name)
+        self.assertRRsetDB(
+            domain, subname="", type_="A", rr_contents={"127.0.0.1", "127.0.0.2"}
+        )
+        self.assertRRsetDB(
+            domain, subname="www", type_="A", rr_contents={"127.0.0.3", "127.0.0.4"}
+        )
+        self.assertRRsetDB(
+            domain, subname="", type_="MX", rr_contents={"10 example.com."}
+        )
+
     def test_create_domain_zonefile_import_foreign_rrset(self):
         zonefile = f"""$ORIGIN .
 $TTL 43200 ; 12 hours
@@ -595,9 +921,7 @@ inject.{self.other_domain.name}. CNAME a.example.
 """
         name = "import-me.example"
         with self.assertRequests(
-            self.requests_desec_domain_creation(name, axfr=False, keys=False)
-            + self.requests_desec_rr_sets_update(name)
-            + [self.request_pdns_zone_retrieve_crypto_keys(name)]
+            self.requests_desec_domain_creation(name, rr_sets=True)
         ):
             response = self.client.post(
                 self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
@@ -616,9 +940,7 @@ import-me.example MX 10 example.com.
 """
         name = "import-me.example"
         with self.assertRequests(
-            self.requests_desec_domain_creation(name, axfr=False, keys=False)
-            + self.requests_desec_rr_sets_update(name)
-            + [self.request_pdns_zone_retrieve_crypto_keys(name)]
+            self.requests_desec_domain_creation(name, rr_sets=True)
         ):
             response = self.client.post(
                 self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
@@ -639,9 +961,7 @@ example.net. 3600 PTR mail.example.net.
 example.net. 3600 PTR mail.example.org."""
         name = "example.net"
         with self.assertRequests(
-            self.requests_desec_domain_creation(name, axfr=False, keys=False)
-            + self.requests_desec_rr_sets_update(name)
-            + [self.request_pdns_zone_retrieve_crypto_keys(name)]
+            self.requests_desec_domain_creation(name, rr_sets=True)
         ):
             response = self.client.post(
                 self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
@@ -667,9 +987,7 @@ import-me.example AAAA 0000::1
 """
         name = "import-me.example"
         with self.assertRequests(
-            self.requests_desec_domain_creation(name, axfr=False, keys=False)
-            + self.requests_desec_rr_sets_update(name)
-            + [self.request_pdns_zone_retrieve_crypto_keys(name)]
+            self.requests_desec_domain_creation(name, rr_sets=True)
         ):
             response = self.client.post(
                 self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
@@ -731,9 +1049,7 @@ import-me.example RRSIG A 13 2 3600 20220324000000 20220303000000 40316 @ 4wj6Zr
 """
         name = "import-me.example"
         with self.assertRequests(
-            self.requests_desec_domain_creation(name, axfr=False, keys=False)
-            + self.requests_desec_rr_sets_update(name)
-            + [self.request_pdns_zone_retrieve_crypto_keys(name)]
+            self.requests_desec_domain_creation(name, rr_sets=True)
         ):
             response = self.client.post(
                 self.reverse("v1:domain-list"), {"name": name, "zonefile": zonefile}
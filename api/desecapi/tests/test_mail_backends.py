@@ -1,9 +1,12 @@
+import smtplib
 from unittest import mock
 
 from django.conf import settings
 from django.core import mail
+from django.core.mail.backends import locmem
 from django.core.mail import EmailMessage, get_connection
 from django.test import TestCase
+from prometheus_client import REGISTRY
 
 from desecapi import mail_backends
 
@@ -43,3 +46,106 @@ class MultiLaneEmailBackendTestCase(TestCase):
 
         # Check that the backend hasn't modified the dict we passed
         self.assertEqual(debug_params, debug_params_orig)
+
+    def tearDown(self):
+        mail_backends.MultiLaneEmailBackend.close_connections()
+        super().tearDown()
+
+    def send_messages(self, lane, n):
+        connection = get_connection(
+            "desecapi.mail_backends.MultiLaneEmailBackend",
+            lane=lane,
+            backbackend=self.test_backend,
+        )
+        messages = [
+            EmailMessage(subject=f"Test {i}", to=["to@test.invalid"]) for i in range(n)
+        ]
+        return connection.send_messages(messages)
+
+    def test_batches(self):
+        with (
+            mock.patch.object(
+                mail_backends.TASKS["email_slow_lane"], "delay", create=True
+            ) as slow,
+            mock.patch.object(
+                mail_backends.TASKS["email_immediate_lane"], "delay", create=True
+            ) as immediate,
+        ):
+            # Rate-limited lanes get one task per message
+            self.assertEqual(self.send_messages("email_slow_lane", 3), 3)
+            self.assertEqual(
+                [len(call.args[0]) for call in slow.call_args_list], [1, 1, 1]
+            )
+            # Other lanes get one task for all messages
+            self.assertEqual(self.send_messages("email_immediate_lane", 3), 3)
+            self.assertEqual(
+                [len(call.args[0]) for call in immediate.call_args_list], [3]
+            )
+
+    def test_failure_per_message(self):
+        locmem_send_messages = locmem.EmailBackend.send_messages
+
+        def send_messages(connection, messages):
+            if messages[0].subject == "Test 1":
+                raise smtplib.SMTPRecipientsRefused({"to@test.invalid": (550, b"")})
+            return locmem_send_messages(connection, messages)
+
+        def sample(name):
+            labels = {"lane": "email_immediate_lane"}
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        before = (
+            sample("desecapi_email_sent_total"),
+            sample("desecapi_email_failed_total"),
+        )
+        with (
+            mock.patch.object(
+                locmem.EmailBackend,
+                "send_messages",
+                autospec=True,
+                side_effect=send_messages,
+            ),
+            self.assertLogs(mail_backends.logger, "ERROR") as logs,
+        ):
+            self.send_messages("email_immediate_lane", 3)
+        self.assertEqual(len(logs.records), 1)
+
+        # The other messages of the batch are still sent
+        self.assertEqual(
+            [message.subject for message in mail.outbox], ["Test 0", "Test 2"]
+        )
+        self.assertEqual(sample("desecapi_email_sent_total"), before[0] + 2)
+        self.assertEqual(sample("desecapi_email_failed_total"), before[1] + 1)
+
+    def test_connection_reuse(self):
+        with mock.patch.object(
+            mail_backends, "get_connection", wraps=get_connection
+        ) as m:
+            self.send_messages("email_immediate_lane", 2)
+            self.send_messages("email_immediate_lane", 2)
+            self.assertEqual(m.call_count, 1)
+            self.send_messages("email_fast_lane", 1)
+            self.assertEqual(m.call_count, 2)  # separate connection per lane
+
+            # Connection is renewed after sending connection_max_messages messages
+            with mock.patch.object(
+                mail_backends.MultiLaneEmailBackend, "connection_max_messages", 5
+            ):
+                self.send_messages("email_immediate_lane", 1)
+                self.send_messages("email_immediate_lane", 1)
+            self.assertEqual(m.call_count, 3)
+        self.assertEqual(len(mail.outbox), 7)
+
+    def test_connection_idle_timeout(self):
+        self.send_messages("email_immediate_lane", 1)
+        connections = mail_backends.MultiLaneEmailBackend._connections
+        ((_, num_messages, timer),) = connections.values()
+        self.assertEqual(num_messages, 1)
+        self.assertEqual(
+            timer.interval, mail_backends.MultiLaneEmailBackend.connection_idle_timeout
+        )
+
+        # Connection is closed when the timer fires
+        timer.cancel()
+        timer.function(*timer.args)
+        self.assertEqual(connections, {})
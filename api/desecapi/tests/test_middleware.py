@@ -0,0 +1,74 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from prometheus_client import REGISTRY
+from rest_framework import status
+
+from desecapi.middleware import fingerprint
+from desecapi.tests.base import DomainOwnerTestCase
+
+
+class QueryMetricsMiddlewareTestCase(DomainOwnerTestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint(
+                'SELECT "x" FROM "desecapi_rr"\n  WHERE "rrset_id" IN (%s, %s, %s) AND "ttl" > 60'
+            ),
+            'SELECT "x" FROM "desecapi_rr" WHERE "rrset_id" IN (...) AND "ttl" > ?',
+        )
+        self.assertEqual(
+            fingerprint("SELECT 1 FROM t WHERE name = 'it''s' LIMIT 21"),
+            "SELECT ? FROM t WHERE name = ? LIMIT ?",
+        )
+
+    @override_settings(QUERY_METRICS_SAMPLE_RATE=1)
+    def test_query_metrics(self):
+        labels = dict(view="RRsetList", method="GET")
+        count = "desecapi_view_db_queries_count"
+        queries = "desecapi_view_db_queries_sum"
+        before = self.sample(count, **labels), self.sample(queries, **labels)
+        response = self.client.get_rr_sets(self.my_domain.name)
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(self.sample(count, **labels), before[0] + 1)
+        self.assertGreater(self.sample(queries, **labels), before[1])
+
+    @override_settings(QUERY_METRICS_SAMPLE_RATE=1)
+    def test_query_metrics_streaming(self):
+        labels = dict(view="RRsetList", method="GET")
+        count = "desecapi_view_db_queries_count"
+        queries = "desecapi_view_db_queries_sum"
+        before = self.sample(count, **labels), self.sample(queries, **labels)
+        url = self.reverse("v1:rrsets", name=self.my_domain.name)
+        response = self.client.get(url, HTTP_ACCEPT="application/x-ndjson")
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+
+        # RRsets are queried while the response is consumed, so nothing is observed before
+        self.assertEqual(self.sample(count, **labels), before[0])
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(b"".join(response.streaming_content))
+        self.assertTrue(context.captured_queries)
+        self.assertEqual(self.sample(count, **labels), before[0] + 1)
+        self.assertGreaterEqual(
+            self.sample(queries, **labels) - before[1], len(context.captured_queries)
+        )
+
+    @override_settings(QUERY_METRICS_SAMPLE_RATE=0)
+    def test_query_metrics_not_sampled(self):
+        labels = dict(view="RRsetList", method="GET")
+        before = self.sample("desecapi_view_db_queries_count", **labels)
+        self.client.get_rr_sets(self.my_domain.name)
+        self.assertEqual(
+            self.sample("desecapi_view_db_queries_count", **labels), before
+        )
+
+    @override_settings(QUERY_METRICS_SAMPLE_RATE=1, QUERY_METRICS_SLOW_REQUEST=0)
+    def test_slow_request_log(self):
+        with self.assertLogs("desecapi.middleware", "WARNING") as cm:
+            self.client.get_rr_sets(self.my_domain.name)
+        self.assertIn("Slow request: GET", cm.output[0])
+        self.assertIn("(RRsetList)", cm.output[0])
+        self.assertIn('FROM "desecapi_rrset"', cm.output[0])
@@ -0,0 +1,183 @@
+from io import StringIO
+from unittest import mock
+
+import requests
+from django.core.management import CommandError, call_command
+from prometheus_client import REGISTRY
+from rest_framework import status
+
+from desecapi import pdns
+from desecapi.exceptions import PDNSException, PDNSUnavailable
+from desecapi.pdns_change_tracker import PDNSChangeTracker
+from desecapi.tests.base import DomainOwnerTestCase
+
+
+@mock.patch("desecapi.pdns.time.sleep")
+class PDNSRequestTestCase(DomainOwnerTestCase):
+    def failing(self, request, status=503):
+        return {**request, "status": status, "body": ""}
+
+    def unreachable(self, request):
+        return {**request, "body": requests.ConnectionError()}
+
+    def test_get_retried(self, sleep):
+        with self.assertRequests(
+            self.failing(
+                self.request_pdns_zone_retrieve_crypto_keys(self.my_domain.name)
+            ),
+            self.unreachable(
+                self.request_pdns_zone_retrieve_crypto_keys(self.my_domain.name)
+            ),
+            self.request_pdns_zone_retrieve_crypto_keys(self.my_domain.name),
+        ):
+            self.assertTrue(pdns.get_keys(self.my_domain))
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_get_retries_exhausted(self, sleep):
+        request = self.request_pdns_zone_retrieve_crypto_keys(self.my_domain.name)
+        with self.assertRequests(*[self.failing(request, 502)] * 3):
+            with self.assertRaises(PDNSException) as cm:
+                pdns.get_keys(self.my_domain)
+        self.assertEqual(cm.exception.response.status_code, 502)
+
+    def test_client_error_not_retried(self, sleep):
+        request = self.request_pdns_zone_retrieve_crypto_keys(self.my_domain.name)
+        with self.assertRequests(self.failing(request, 422)):
+            with self.assertRaises(PDNSException):
+                pdns.get_keys(self.my_domain)
+        sleep.assert_not_called()
+
+    def test_replace_patch_retried(self, sleep):
+        with self.assertRequests(
+            self.unreachable(self.request_pdns_update_catalog()),
+            self.request_pdns_update_catalog(),
+        ):
+            pdns.update_catalog([self.my_domain.name])
+
+    @mock.patch("desecapi.pdns.random.uniform", lambda a, b: b)
+    def test_retry_budget(self, sleep):
+        request = self.request_pdns_zone_retrieve_crypto_keys(self.my_domain.name)
+        with self.assertRequests(*[self.failing(request)] * 2):
+            with pdns.retry_budget(0.2), self.assertRaises(PDNSException):
+                pdns.get_keys(self.my_domain)
+        # The budget is used up after the first retry
+        sleep.assert_called_once_with(0.2)
+
+        # Change trackers share their budget across threads
+        budgets = []
+        with pdns.retry_budget(1):
+            PDNSChangeTracker._call_per_zone(
+                lambda zone: budgets.append(pdns._retry_budget.get()),
+                ["a.example.", "b.example.", "c.example."],
+                zone=str,
+            )
+        self.assertEqual(len(budgets), 3)
+        self.assertIsNotNone(budgets[0])
+        self.assertTrue(all(budget is budgets[0] for budget in budgets))
+
+    def test_post_not_retried(self, sleep):
+        with self.assertRequests(
+            self.failing(self.request_pdns_zone_create(ns="LORD"))
+        ):
+            with self.assertRaises(PDNSException):
+                pdns.create_zone_lord("retry.example.")
+        sleep.assert_not_called()
+
+    @mock.patch.multiple(
+        "django.conf.settings", PDNS_RETRIES=0, PDNS_CIRCUIT_BREAKER_THRESHOLD=2
+    )
+    def test_circuit_breaker(self, sleep):
+        request = self.request_pdns_zone_retrieve_crypto_keys(self.my_domain.name)
+        with self.assertRequests(*[self.failing(request)] * 2):
+            for _ in range(2):
+                with self.assertRaises(PDNSException):
+                    pdns.get_keys(self.my_domain)
+
+        # Circuit is open: fail without contacting nslord, but don't affect nsmaster
+        with self.assertRequests(self.request_pdns_zone_axfr(self.my_domain.name)):
+            with self.assertRaises(PDNSUnavailable):
+                pdns.get_keys(self.my_domain)
+            pdns.axfr_to_master(self.my_domain.name)
+
+        # Once the timeout has passed, a successful request closes the circuit
+        with self.settings(PDNS_CIRCUIT_BREAKER_TIMEOUT=0):
+            with self.assertRequests(request):
+                pdns.get_keys(self.my_domain)
+        with self.assertRequests(request):
+            pdns.get_keys(self.my_domain)
+
+    def test_circuit_open_service_unavailable(self, sleep):
+        pdns._circuit_breakers[pdns.NSLORD].opened = pdns.time.monotonic()
+        with self.assertRequests():
+            response = self.client.post_rr_set(
+                self.my_domain.name,
+                subname="unavailable",
+                type="A",
+                ttl=3600,
+                records=["1.2.3.4"],
+            )
+        self.assertStatus(response, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn("Retry-After", response)
+        self.assertFalse(
+            self.my_domain.rrset_set.filter(subname="unavailable").exists()
+        )
+
+    def test_circuit_open_commands(self, sleep):
+        pdns._circuit_breakers[pdns.NSLORD].opened = pdns.time.monotonic()
+        for args in [
+            ("sync-to-pdns", self.my_domain.name),
+            ("sync-to-pdns", "--diff", self.my_domain.name),
+            ("align-catalog-zone",),
+        ]:
+            with self.assertRequests():
+                with self.assertRaisesMessage(CommandError, "pdns unavailable"):
+                    call_command(*args, stdout=StringIO())
+
+    @mock.patch.object(requests.Response, "close", autospec=True)
+    def test_retried_response_closed(self, close, sleep):
+        with self.assertRequests(
+            self.failing(self.request_pdns_zone_retrieve_zone_export()),
+            self.request_pdns_zone_retrieve_zone_export(),
+        ):
+            pdns.get_zonefile(self.my_domain)
+        self.assertIn(503, [call.args[0].status_code for call in close.call_args_list])
+
+
+class PDNSMetricsTestCase(DomainOwnerTestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_path_template(self):
+        for path, template in [
+            ("/zones", "/zones"),
+            ("/zones?rrsets=false", "/zones"),
+            ("/zones/example.com.", "/zones/{id}"),
+            ("/zones/example.com./axfr-retrieve", "/zones/{id}/axfr-retrieve"),
+            ("/zones/=5Fsub.example.com./cryptokeys", "/zones/{id}/cryptokeys"),
+        ]:
+            self.assertEqual(pdns._path_template(path), template)
+
+    def test_request_metrics(self):
+        labels = dict(server="nslord", method="patch", path="/zones/{id}")
+        count = "desecapi_pdns_request_duration_seconds_count"
+        size = "desecapi_pdns_request_body_size_bytes_sum"
+        phase = "desecapi_pdns_change_tracker_phase_duration_seconds_count"
+        before = (
+            self.sample(count, **labels),
+            self.sample(size, **labels),
+            self.sample(phase, phase="axfr"),
+        )
+        with self.assertRequests(
+            self.requests_desec_rr_sets_update(self.my_domain.name)
+        ):
+            response = self.client.post_rr_set(
+                self.my_domain.name,
+                subname="metrics",
+                type="A",
+                ttl=3600,
+                records=["1.2.3.4"],
+            )
+        self.assertStatus(response, status.HTTP_201_CREATED)
+        self.assertEqual(self.sample(count, **labels), before[0] + 1)
+        self.assertGreater(self.sample(size, **labels), before[1])
+        self.assertEqual(self.sample(phase, phase="axfr"), before[2] + 1)
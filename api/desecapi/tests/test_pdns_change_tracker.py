@@ -1,5 +1,9 @@
+import threading
+from unittest import mock
+
 from django.utils import timezone
 
+from desecapi import pdns
 from desecapi.models import RRset, RR, Domain
 from desecapi.pdns_change_tracker import PDNSChangeTracker
 from desecapi.tests.base import DesecTestCase
@@ -622,8 +626,13 @@ class DomainTestCase(PdnsChangeTrackerTestCase):
         with (
             self.assertRequests(
                 [
-                    self.requests_desec_domain_deletion(domain)
+                    self.requests_desec_domain_deletion(domain, memberships=False)
                     for domain in reversed(self.domains)
+                ]
+                + [
+                    # one catalog and one PCH request for all domains
+                    self.request_pdns_update_catalog(),
+                    self.request_pch_zone_delete(name=None),
                 ],
                 expect_order=False,
             ),
@@ -648,3 +657,46 @@ class DomainTestCase(PdnsChangeTrackerTestCase):
         with self.assertPdnsZoneUpdate(name, []), PDNSChangeTracker():
             self.full_domain.delete()
             self.full_domain = Domain.objects.create(name=name, owner=self.user)
+
+    def test_update_zones_concurrently(self):
+        # zone updates only pass the barrier if they are sent concurrently
+        barrier = threading.Barrier(len(self.domains), timeout=5)
+        update_zone = pdns.update_zone
+
+        def update_zone_concurrently(name, data):
+            barrier.wait()
+            update_zone(name, data)
+
+        with (
+            mock.patch.object(pdns, "update_zone", update_zone_concurrently),
+            self.assertRequests(
+                [self.request_pdns_zone_update(domain.name) for domain in self.domains]
+                + [self.request_pdns_zone_axfr(domain.name) for domain in self.domains],
+                expect_order=False,
+            ),
+            PDNSChangeTracker(),
+        ):
+            for domain in self.domains:
+                domain.rrset_set.create(
+                    subname="new", type="A", ttl=3600, contents=["1.2.3.4"]
+                )
+
+    def test_update_zones_concurrently_failure(self):
+        def update_zone(name, data):
+            if name == self.simple_domain.name:
+                raise RuntimeError("pdns unavailable")
+
+        with (
+            mock.patch.object(pdns, "update_zone", update_zone),
+            self.assertRaises(ValueError) as cm,
+            PDNSChangeTracker(),
+        ):
+            for domain in self.domains:
+                domain.rrset_set.create(
+                    subname="new", type="A", ttl=3600, contents=["1.2.3.4"]
+                )
+        self.assertIn(
+            f"occurred during Update RRsets of {self.simple_domain.name}",
+            str(cm.exception),
+        )
+        self.assertFalse(RRset.objects.filter(subname="new").exists())
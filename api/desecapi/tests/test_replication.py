@@ -1,11 +1,23 @@
+import gzip
 import json
+import time
+from unittest import mock
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
 from rest_framework import status
 
+from desecapi.pdns import construct_catalog_rrset
 from desecapi.tests.base import DesecTestCase
+from desecapi.views import SerialListView
 
 
 class ReplicationTest(DesecTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
     def test_serials(self):
         url = self.reverse("v1:serial")
         zones = [
@@ -22,15 +34,199 @@ class ReplicationTest(DesecTestCase):
             }
         ]
 
+        # Not published yet: fetched from nsmaster by one request, others are asked to retry
+        cache.add("desecapi.views.serials.sentinel", True)
+        with self.assertRequests():
+            response = self.client.get(path=url, REMOTE_ADDR="10.8.0.2")
+        self.assertStatus(response, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn("Retry-After", response)
+        cache.delete("desecapi.views.serials.sentinel")
+        with self.assertRequests(pdns_requests):
+            response = self.client.get(path=url, REMOTE_ADDR="10.8.0.2")
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), serials)
+
+        # Snapshots expire, so that stale ones are not served; the next request then fetches live
+        expired = time.time() + SerialListView.snapshot_timeout + 1
+        with mock.patch(
+            "django.core.cache.backends.locmem.time.time", return_value=expired
+        ):
+            with self.assertRequests(pdns_requests):
+                response = self.client.get(path=url, REMOTE_ADDR="10.8.0.2")
+            self.assertStatus(response, status.HTTP_200_OK)
+            self.assertEqual(json.loads(response.content), serials)
+
+        with self.assertRequests(pdns_requests):
+            call_command("refresh-serials")
+
         # Run twice to make sure cache output varies on remote address
         for i in range(2):
             response = self.client.get(path=url, REMOTE_ADDR="123.8.0.2")
             self.assertStatus(response, status.HTTP_401_UNAUTHORIZED)
 
-            with self.assertRequests(pdns_requests):
+            # Requests are served from the published snapshot
+            with self.assertRequests():
                 response = self.client.get(path=url, REMOTE_ADDR="10.8.0.2")
             self.assertStatus(response, status.HTTP_200_OK)
-            self.assertEqual(response.data, serials)
+            self.assertEqual(json.loads(response.content), serials)
 
-            # Do not expect pdns request in next iteration (result will be cached)
-            pdns_requests = []
+        # Precompressed
+        response = self.client.get(
+            path=url, REMOTE_ADDR="10.8.0.2", HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content)), serials)
+
+    def test_serials_since(self):
+        url = self.reverse("v1:serial")
+
+        def get(zones=None, **kwargs):
+            if zones is not None:
+                body = [{"name": k, "edited_serial": v} for k, v in zones.items()]
+                with self.assertRequests(
+                    {
+                        "method": "GET",
+                        "url": self.get_full_pdns_url(r"/zones", ns="MASTER"),
+                        "status": 200,
+                        "body": json.dumps(body),
+                    }
+                ):
+                    call_command("refresh-serials")
+            with self.assertRequests():
+                return self.client.get(path=url, REMOTE_ADDR="10.8.0.2", **kwargs)
+
+        zones = {"test.example.": 12345, "example.org.": 54321}
+        response = get(zones, data={"since": ""})
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertTrue(response.data["full"])
+        self.assertEqual(response.data["serials"], zones)
+        token = response.data["token"]
+
+        # Nothing changed
+        response = get(data={"since": token})
+        self.assertEqual(response.data, {"token": token, "full": False, "serials": {}})
+
+        # Conditional request
+        response = get(data={"since": token}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertStatus(response, status.HTTP_304_NOT_MODIFIED)
+
+        # Changes accumulate across updates
+        get({"test.example.": 12346, "example.org.": 54321, "new.example.": 1})
+        response = get({"test.example.": 12347, "new.example.": 1})
+        self.assertEqual(
+            json.loads(response.content), {"test.example.": 12347, "new.example.": 1}
+        )
+        response = get(data={"since": token})
+        self.assertFalse(response.data["full"])
+        self.assertEqual(
+            response.data["serials"],
+            {"test.example.": 12347, "example.org.": None, "new.example.": 1},
+        )
+        self.assertNotEqual(response.data["token"], token)
+
+        # Unknown token yields everything
+        for since in ["foo", token + "0", "0" + token, "foo\nbar", token + "\n"]:
+            response = get(data={"since": since})
+            self.assertTrue(response.data["full"])
+            self.assertEqual(
+                response.data["serials"], {"test.example.": 12347, "new.example.": 1}
+            )
+
+        # Compression
+        zones = {f"{i}.example.": i for i in range(100)}
+        response = get(zones, data={"since": token}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        for data in [{}, {"since": token}]:
+            for accept_encoding in ["gzip;q=0", "*;q=0", "br, gzip; q=0.0", "x"]:
+                response = get(data=data, HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertNotIn("Content-Encoding", response)
+                self.assertIn("Accept-Encoding", response["Vary"])
+            for accept_encoding in ["gzip;q=0.5", "br, gzip"]:
+                response = get(data=data, HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_serials_concurrent_refresh(self):
+        url = self.reverse("v1:serial")
+
+        def refresh(serials):
+            with mock.patch("desecapi.views.domains.get_serials", return_value=serials):
+                state = SerialListView.refresh()
+            return f"{state['epoch']}.{state['version']}"
+
+        refresh({"a.example.": 1, "b.example.": 1})
+
+        # Another refresh publishes a version while this one is computing its changes
+        add = cache.add
+        concurrent = []
+
+        def concurrent_add(*args, **kwargs):
+            if not concurrent:
+                concurrent.append(None)
+                concurrent[0] = refresh({"a.example.": 2, "b.example.": 1})
+            return add(*args, **kwargs)
+
+        with mock.patch.object(cache, "add", side_effect=concurrent_add):
+            token = refresh({"a.example.": 2, "b.example.": 2})
+
+        # Clients that saw the concurrently published version don't miss later changes
+        self.assertNotEqual(token, concurrent[0])
+        response = self.client.get(
+            path=url, REMOTE_ADDR="10.8.0.2", data={"since": concurrent[0]}
+        )
+        self.assertEqual(
+            response.data, {"token": token, "full": False, "serials": {"b.example.": 2}}
+        )
+
+    def test_align_catalog_zone_incremental(self):
+        catalog_rrsets = [
+            construct_catalog_rrset(subname="", qtype="NS", rdata="invalid."),
+            construct_catalog_rrset(subname="version", qtype="TXT", rdata='"2"'),
+            construct_catalog_rrset(zone="kept.example."),
+            construct_catalog_rrset(zone="removed.example."),
+        ]
+        soa = {
+            "name": f"{settings.CATALOG_ZONE}.",
+            "type": "SOA",
+            "records": [{"content": "a. b. 5 86400 3600 2419200 3600"}],
+        }
+
+        def request_patch(expected):
+            def request_callback(request):
+                rrsets = json.loads(request.body)["rrsets"]
+                self.assertEqual(
+                    {(rrset["name"], bool(rrset["records"])) for rrset in rrsets},
+                    expected,
+                )
+                return [200, {}, ""]
+
+            return {
+                "method": "PATCH",
+                "url": self.get_full_pdns_url(
+                    self.PDNS_ZONE, ns="MASTER", id=f"{settings.CATALOG_ZONE}."
+                ),
+                "callback": request_callback,
+            }
+
+        with self.assertRequests(
+            {
+                "method": "GET",
+                "url": self.get_full_pdns_url(r"/zones"),
+                "status": 200,
+                "body": json.dumps(
+                    [{"name": zone} for zone in ["kept.example.", "added.example."]]
+                ),
+            },
+            {
+                "method": "GET",
+                "url": self.get_full_pdns_url(
+                    self.PDNS_ZONE, ns="MASTER", id=f"{settings.CATALOG_ZONE}."
+                ),
+                "status": 200,
+                "body": json.dumps({"rrsets": [soa, *catalog_rrsets]}),
+            },
+            request_patch(
+                {(construct_catalog_rrset(zone="added.example.")["name"], True)}
+            ),
+            request_patch({(catalog_rrsets[3]["name"], False)}),
+        ):
+            call_command("align-catalog-zone", "--incremental", "--batch-size=1")
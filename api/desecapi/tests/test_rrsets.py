@@ -1,14 +1,20 @@
+import importlib
+import json
 import re
+import threading
 from base64 import b64encode
 from contextlib import nullcontext
+from io import StringIO
 from ipaddress import IPv4Network
 from itertools import product
 from math import ceil, floor
+from unittest import mock
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from psycopg.errors import UniqueViolation
 from rest_framework import status
 
@@ -16,6 +22,8 @@ from desecapi.models import BlockedSubnet, Domain, RR, RRset
 from desecapi.models.records import RR_SET_TYPES_AUTOMATIC, RR_SET_TYPES_UNSUPPORTED
 from desecapi.tests.base import DesecTestCase, AuthenticatedRRSetBaseTestCase
 
+sync_to_pdns = importlib.import_module("desecapi.management.commands.sync-to-pdns")
+
 
 class UnauthenticatedRRSetTestCase(DesecTestCase):
     def test_unique_record_in_rrset(self):
@@ -108,13 +116,27 @@ class AuthenticatedRRSetTestCase(AuthenticatedRRSetBaseTestCase):
         )
 
         # No pagination
-        response = self.client.get_rr_sets(self.my_domain.name)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get_rr_sets(self.my_domain.name)
         self.assertStatus(response, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(
             response.data["detail"],
-            f"Pagination required. You can query up to {settings.REST_FRAMEWORK['PAGE_SIZE']} items at a time ({n + 1} total). "
+            f"Pagination required. You can query up to {settings.REST_FRAMEWORK['PAGE_SIZE']} items at a time. "
             "Please use the `first` page link (see Link header).",
         )
+        # Neither counting nor fetching the page is needed to determine that pagination is required
+        self.assertFalse(
+            [q for q in context.captured_queries if "COUNT(" in q["sql"]],
+            context.captured_queries,
+        )
+        self.assertFalse(
+            [
+                q
+                for q in context.captured_queries
+                if '"desecapi_rrset"."ttl"' in q["sql"]
+            ],
+            context.captured_queries,
+        )
         links = convert_links(response["Link"])
         self.assertEqual(len(links), 1)
         self.assertTrue(links["first"].endswith("/?cursor="))
@@ -149,6 +171,68 @@ class AuthenticatedRRSetTestCase(AuthenticatedRRSetBaseTestCase):
         # Make sure that one step forward equals two steps forward and one step back
         self.assertEqual(response.data, data_next)
 
+    def test_retrieve_my_rr_sets_query_count(self):
+        # Query count must not depend on the number of RRsets or records
+        for n in [1, settings.REST_FRAMEWORK["PAGE_SIZE"]]:
+            domain = self.create_domain(owner=self.owner)
+            for i in range(n):
+                self.create_rr_set(
+                    domain, ["1.2.3.4", "5.6.7.8"], subname=str(i), type="A", ttl=3600
+                )
+            with self.assertNumQueries(7):
+                response = self.client.get_rr_sets(domain.name, query="?cursor=")
+            self.assertStatus(response, status.HTTP_200_OK)
+            self.assertEqual(len(response.data), n)
+            for data in response.data:
+                self.assertEqual(data["domain"], domain.name)
+                self.assertEqual(set(data["records"]), {"1.2.3.4", "5.6.7.8"})
+
+    def test_retrieve_my_rr_sets_ndjson(self):
+        n = int(settings.REST_FRAMEWORK["PAGE_SIZE"] * 2.5)
+        for i in range(n):
+            self.create_rr_set(
+                self.my_domain, [f"10.0.0.{i}"], subname=str(i), type="A", ttl=123
+            )
+        RRset.objects.create(domain=self.my_domain, subname="empty", type="A", ttl=123)
+
+        url = self.reverse("v1:rrsets", name=self.my_domain.name)
+        response = self.client.get(url, HTTP_ACCEPT="application/x-ndjson")
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertFalse(response.has_header("Link"))
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rrsets = [json.loads(line) for line in lines]
+        self.assertEqual(len(rrsets), n + 1)  # including apex A, excluding empty
+        self.assertEqual(
+            [rrset["subname"] for rrset in rrsets],
+            [str(i) for i in reversed(range(n))] + [""],
+        )
+        self.assertRRSet(
+            rrsets[0],
+            domain=self.my_domain.name,
+            subname=str(n - 1),
+            records=[f"10.0.0.{n - 1}"],
+            type_="A",
+            ttl=123,
+        )
+
+        response = self.client.get(
+            url, {"type": "A"}, HTTP_ACCEPT="application/x-ndjson"
+        )
+        self.assertStatus(response, status.HTTP_200_OK)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), n + 1)
+
+    def test_retrieve_other_rr_sets_ndjson(self):
+        response = self.client.get(
+            self.reverse("v1:rrsets", name=self.other_domain.name),
+            HTTP_ACCEPT="application/x-ndjson",
+        )
+        self.assertStatus(response, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(json.loads(response.content), {"detail": "Not found."})
+
     def test_retrieve_other_rr_sets(self):
         self.assertStatus(
             self.client.get_rr_sets(self.other_domain.name), status.HTTP_404_NOT_FOUND
@@ -1546,6 +1630,160 @@ class AuthenticatedRRSetTestCase(AuthenticatedRRSetBaseTestCase):
                 [dict(subname="", records=settings.DEFAULT_NS, type="NS")],
             )
 
+    def test_sync_rr_sets_diff(self):
+        self.my_domain.rrset_set.all().delete()
+        self.create_rr_set(self.my_domain, settings.DEFAULT_NS, type="NS", ttl=60)
+
+        # Zone is in sync: no update, no AXFR
+        with self.assertRequests(
+            self.request_pdns_zone_retrieve(name=self.my_domain.name)
+        ):
+            call_command("sync-to-pdns", "--diff", self.my_domain.name)
+
+        # Only the differing RRset is written
+        rr_set = self.create_rr_set(
+            self.my_domain, ["1.2.3.4"], type="A", subname="www", ttl=3600
+        )
+        with self.assertRequests(
+            self.request_pdns_zone_retrieve(name=self.my_domain.name),
+            self.request_pdns_zone_update_assert_body(
+                name=self.my_domain.name, updated_rr_sets=[rr_set]
+            ),
+            self.request_pdns_zone_axfr(name=self.my_domain.name),
+        ):
+            call_command("sync-to-pdns", "--diff", self.my_domain.name)
+
+    def request_pdns_zone_update_capture(self, name, bodies):
+        request = self.request_pdns_zone_update(name=name)
+        request.pop("status")
+        request.pop("body")
+        request["callback"] = lambda request: (
+            bodies.append(json.loads(request.body)) or (200, {}, "")
+        )
+        return request
+
+    def request_pdns_zone_retrieve_rrsets(self, name, rrsets):
+        request = self.request_pdns_zone_retrieve(name=name)
+        body = json.loads(request["body"])
+        body["rrsets"] += [
+            {
+                "name": ".".join(filter(None, [subname, name])) + ".",
+                "type": type_,
+                "ttl": ttl,
+                "records": [{"content": content} for content in contents],
+            }
+            for subname, type_, ttl, contents in rrsets
+        ]
+        request["body"] = json.dumps(body)
+        return request
+
+    def test_sync_rr_sets_diff_missing_zone(self):
+        self.my_domain.rrset_set.all().delete()
+        self.create_rr_set(self.my_domain, settings.DEFAULT_NS, type="NS", ttl=60)
+        self.create_rr_set(self.my_domain, ["1.2.3.4"], type="A", ttl=3600)
+        retrieve = self.request_pdns_zone_retrieve(name=self.my_domain.name)
+        bodies = []
+
+        for status_code in (404, 422):
+            bodies.clear()
+            with (
+                self.assertRequests(
+                    {**retrieve, "status": status_code, "body": ""},
+                    self.request_pdns_zone_create(ns="LORD"),
+                    self.request_pdns_zone_create(ns="MASTER"),
+                    self.request_pdns_update_catalog(),
+                    self.request_pdns_zone_update_capture(self.my_domain.name, bodies),
+                    self.request_pdns_zone_axfr(name=self.my_domain.name),
+                ),
+                mock.patch.object(sync_to_pdns, "call_command") as call_command_,
+            ):
+                call_command("sync-to-pdns", "--diff", self.my_domain.name)
+            # All RRsets are written, and the catalog zone is aligned
+            self.assertEqual(
+                {(rrset["type"], rrset["changetype"]) for rrset in bodies[0]["rrsets"]},
+                {("NS", "REPLACE"), ("A", "REPLACE")},
+            )
+            call_command_.assert_called_once_with("align-catalog-zone", "--incremental")
+
+    def test_sync_rr_sets_diff_extra_rrset(self):
+        self.my_domain.rrset_set.all().delete()
+        self.create_rr_set(self.my_domain, settings.DEFAULT_NS, type="NS", ttl=60)
+        bodies = []
+
+        with self.assertRequests(
+            self.request_pdns_zone_retrieve_rrsets(
+                self.my_domain.name, [("extra", "A", 3600, ["1.2.3.4"])]
+            ),
+            self.request_pdns_zone_update_capture(self.my_domain.name, bodies),
+            self.request_pdns_zone_axfr(name=self.my_domain.name),
+        ):
+            call_command("sync-to-pdns", "--diff", self.my_domain.name)
+        self.assertEqual(
+            [
+                (rrset["name"], rrset["type"], rrset["records"])
+                for rrset in bodies[0]["rrsets"]
+            ],
+            [(f"extra.{self.my_domain.name}.", "A", [])],  # removed
+        )
+
+    def test_sync_rr_sets_diff_normalized_contents(self):
+        self.my_domain.rrset_set.all().delete()
+        self.create_rr_set(self.my_domain, settings.DEFAULT_NS, type="NS", ttl=60)
+        self.create_rr_set(
+            self.my_domain,
+            ["1 . alpn=h2,h3 ipv4hint=192.0.2.1"],
+            type="HTTPS",
+            subname="www",
+            ttl=3600,
+        )
+
+        # pdns presents the record differently, which is not a change: no update, no AXFR
+        with self.assertRequests(
+            self.request_pdns_zone_retrieve_rrsets(
+                self.my_domain.name,
+                [("www", "HTTPS", 3600, ['1 . alpn="h2,h3" ipv4hint="192.0.2.1"'])],
+            )
+        ):
+            call_command("sync-to-pdns", "--diff", self.my_domain.name)
+
+    def test_sync_rr_sets_diff_workers(self):
+        domains = self.my_domains[:2]
+        barrier = threading.Barrier(len(domains), timeout=10)
+        threads = {}
+
+        def sync_domain(domain):
+            barrier.wait()  # only returns if the domains are synced concurrently
+            threads[domain.name] = threading.get_ident()
+            return False, len(domain.name) % 2
+
+        output = StringIO()
+        with mock.patch.object(
+            sync_to_pdns.Command, "_sync_domain_diff", side_effect=sync_domain
+        ):
+            call_command(
+                "sync-to-pdns",
+                "--diff",
+                f"--workers={len(domains)}",
+                *(domain.name for domain in domains),
+                stdout=output,
+            )
+        self.assertEqual(len(set(threads.values())), len(domains))
+        # Results are reported in order
+        lines = output.getvalue().splitlines()
+        self.assertEqual(
+            [line.split(" ", 2)[:2] for line in lines[:-1]],
+            [
+                [f"[{i}/{len(domains)}]", name]
+                for i, name in enumerate(
+                    Domain.objects.filter(
+                        pk__in=[domain.pk for domain in domains]
+                    ).values_list("name", flat=True),
+                    1,
+                )
+            ],
+        )
+        self.assertTrue(lines[-1].startswith(f"Processed {len(domains)} domains"))
+
     def test_extra_dnskeys(self):
         name = "ietf.org"
         dnskeys = [
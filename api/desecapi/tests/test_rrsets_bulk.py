@@ -810,3 +810,84 @@ class AuthenticatedRRSetBulkTestCase(AuthenticatedRRSetBaseTestCase):
 
         qs.create(domain=domain, subname="www", type="A", perm_write=False)
         assertRequests(allowed=False)
+
+
+class AuthenticatedMultiDomainRRSetBulkTestCase(AuthenticatedRRSetBaseTestCase):
+    def test_bulk_patch_several_domains(self):
+        domains = [self.my_domain, self.my_empty_domain]
+        data = [
+            {
+                "domain": domain.name,
+                "subname": "_acme-challenge",
+                "type": "TXT",
+                "ttl": 3600,
+                "records": ['"token"'],
+            }
+            for domain in domains
+        ]
+        with self.assertRequests(
+            *[self.requests_desec_rr_sets_update(domain.name) for domain in domains],
+            expect_order=False,
+        ):
+            response = self.client.patch(self.reverse("v1:bulk-rrsets"), data)
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(
+            {(item["domain"], item["subname"]) for item in response.data},
+            {(domain.name, "_acme-challenge") for domain in domains},
+        )
+        for domain in domains:
+            self.assertRRsetDB(
+                domain, subname="_acme-challenge", type_="TXT", rr_contents={'"token"'}
+            )
+
+        # delete again
+        for item in data:
+            item["records"] = []
+        with self.assertRequests(
+            *[self.requests_desec_rr_sets_update(domain.name) for domain in domains],
+            expect_order=False,
+        ):
+            response = self.client.patch(self.reverse("v1:bulk-rrsets"), data)
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+        for domain in domains:
+            self.assertRRsetDB(domain, subname="_acme-challenge", type_="TXT")
+
+    def test_bulk_patch_several_domains_validation(self):
+        data = [
+            {"domain": self.my_domain.name, "subname": "a", "type": "A", "ttl": 3600},
+            {
+                "domain": self.other_domain.name,
+                "subname": "a",
+                "type": "A",
+                "ttl": 3600,
+                "records": ["1.2.3.4"],
+            },
+            {
+                "domain": self.my_empty_domain.name,
+                "subname": "a",
+                "type": "A",
+                "ttl": 3600,
+                "records": ["1.2.3.4"],
+            },
+            "crap",
+        ]
+        response = self.client.patch(self.reverse("v1:bulk-rrsets"), data)
+        self.assertResponse(
+            response,
+            status.HTTP_400_BAD_REQUEST,
+            [
+                {"records": ["This field is required."]},
+                {"domain": ["This domain does not exist."]},
+                {},
+                {"non_field_errors": ["Expected a dictionary, but got str."]},
+            ],
+        )
+        self.assertFalse(self.my_empty_domain.rrset_set.filter(subname="a").exists())
+
+        response = self.client.patch(self.reverse("v1:bulk-rrsets"), data[2])
+        self.assertResponse(
+            response,
+            status.HTTP_400_BAD_REQUEST,
+            {"non_field_errors": ["Expected a list of items but got dict."]},
+        )
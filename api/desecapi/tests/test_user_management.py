@@ -16,6 +16,7 @@ Furthermore, domain renewals and unused domain/account scavenging are tested.
 """
 
 from datetime import timedelta
+import io
 import random
 import time
 from unittest import mock
@@ -24,7 +25,7 @@ from urllib.parse import urlparse
 from django.contrib.auth.hashers import is_password_usable
 from django.conf import settings
 from django.core import mail
-from django.core.management import call_command
+from django.core.management import call_command, load_command_class
 from django.test import override_settings
 from django.urls import resolve
 from django.utils import timezone
@@ -32,7 +33,7 @@ from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 
-from desecapi.models import Captcha, Domain, Token, User
+from desecapi.models import Captcha, Domain, OutreachCheckpoint, Token, User
 from desecapi.exceptions import AuthenticatedActionInvalidState
 from desecapi.tests.base import (
     DesecTestCase,
@@ -840,6 +841,21 @@ class OtherUserAccountTestCase(UserManagementTestCase):
         )
         self.assertNoEmailSent()
 
+    def test_reset_password_email_templates_cached(self):
+        from desecapi.models import users
+
+        users._get_email_template.cache_clear()
+        with mock.patch.object(
+            users, "get_template", wraps=users.get_template
+        ) as get_template:
+            for _ in range(2):
+                self.assertResetPasswordSuccessResponse(
+                    response=self.reset_password(self.other_email)
+                )
+                self.assertResetPasswordEmail(self.other_email)
+        # content, subject, and from templates are loaded only once
+        self.assertEqual(get_template.call_count, 3)
+
 
 class HasUserAccountTestCase(UserManagementTestCase):
     def __init__(self, methodName: str = ...) -> None:
@@ -1430,6 +1446,72 @@ class RenewTestCase(UserManagementTestCase, DomainOwnerTestCase):
                 Domain.objects.get(pk=domain.pk).renewal_changed, domain.renewal_changed
             )
 
+    def test_renew_domain_fresh_183_days_multiple_users(self):
+        domains = self.my_domains[:2] + [self.create_domain(), self.create_domain()]
+        for domain in domains:
+            domain.published = timezone.now() - timedelta(days=183)
+            domain.renewal_changed = domain.published
+            domain.renewal_state = Domain.RenewalState.FRESH
+            domain.save()
+            domain.rrset_set.update(touched=domain.published)
+
+        with mock.patch.object(User, "send_emails", wraps=User.send_emails) as m:
+            call_command("scavenge-unused")
+        m.assert_called_once()
+        self.assertEqual(len(m.call_args.args[1]), 3)  # one message per user
+        self.assertEqual(len(mail.outbox), 3)
+        for domain in domains:
+            self.assertEqual(
+                Domain.objects.get(pk=domain.pk).renewal_state,
+                Domain.RenewalState.NOTIFIED,
+            )
+
+        # Each user is notified about all of their domains, and about nothing else
+        for owner in {domain.owner for domain in domains}:
+            (email,) = [email for email in mail.outbox if email.to == [owner.email]]
+            for domain in domains:
+                if domain.owner == owner:
+                    self.assertIn(domain.name, email.body)
+                else:
+                    self.assertNotIn(domain.name, email.body)
+
+    def test_renew_domain_fresh_183_days_chunk_failure(self):
+        domains = self.my_domains[:1] + [self.create_domain(), self.create_domain()]
+        for domain in domains:
+            domain.published = timezone.now() - timedelta(days=183)
+            domain.renewal_changed = domain.published
+            domain.renewal_state = Domain.RenewalState.FRESH
+            domain.save()
+            domain.rrset_set.update(touched=domain.published)
+
+        send_emails = User.send_emails
+
+        def fail_second_chunk(reason, messages, **kwargs):
+            if m.call_count > 1:
+                raise RuntimeError("queuing failed")
+            return send_emails(reason, messages, **kwargs)
+
+        command = load_command_class("desecapi", "scavenge-unused")
+        with (
+            mock.patch.object(type(command), "email_chunk_size", 2),
+            mock.patch.object(User, "send_emails", side_effect=fail_second_chunk) as m,
+        ):
+            with self.assertRaises(RuntimeError):
+                command.warn_domain_deletion(Domain.RenewalState.FRESH, 28, 183)
+
+        # The first chunk's users were notified, and their renewal state was committed with it
+        self.assertEqual(len(mail.outbox), 2)
+        notified = {email.to[0] for email in mail.outbox}
+        for domain in domains:
+            self.assertEqual(
+                Domain.objects.get(pk=domain.pk).renewal_state,
+                (
+                    Domain.RenewalState.NOTIFIED
+                    if domain.owner.email in notified
+                    else Domain.RenewalState.FRESH
+                ),
+            )
+
     def test_renew_domain_notified_21_days(self):
         domain = self.my_domains[0]
         domain.published = timezone.now() - timedelta(days=183 + 21)
@@ -1510,6 +1592,110 @@ class RenewTestCase(UserManagementTestCase, DomainOwnerTestCase):
                     Domain.RenewalState.NOTIFIED,
                 )
 
+    def test_renew_domain_warned_7_days_multiple(self):
+        domains = self.my_domains
+        self.assertGreaterEqual(len(domains), 2)
+        for domain in domains:
+            domain.published = timezone.now() - timedelta(days=183 + 28)
+            domain.renewal_state = Domain.RenewalState.WARNED
+            domain.renewal_changed = timezone.now() - timedelta(days=7)
+            domain.save()
+            domain.rrset_set.update(touched=domain.published)
+
+        # One catalog and PCH update in total, and one delegation update per parent zone
+        parents = {
+            self._find_auto_delegation_zone(domain.name)
+            for domain in domains
+            if domain.is_locally_registrable
+        }
+        with self.assertRequests(
+            [
+                self.requests_desec_domain_deletion(domain, memberships=False)[:2]
+                for domain in domains
+            ]
+            + [
+                self.request_pdns_update_catalog(),
+                self.request_pch_zone_delete(name=None),
+            ]
+            + [
+                [
+                    self.request_pdns_zone_update(name=parent),
+                    self.request_pdns_zone_axfr(name=parent),
+                ]
+                for parent in parents
+            ],
+            expect_order=False,
+        ):
+            call_command("scavenge-unused")
+        self.assertFalse(
+            Domain.objects.filter(pk__in=[domain.pk for domain in domains]).exists()
+        )
+        self.assertFalse(User.objects.filter(pk=self.owner.pk).exists())
+
+    def test_renew_domain_warned_7_days_batch_failure(self):
+        domains = self.my_domains
+        self.assertGreaterEqual(len(domains), 2)
+        for domain in domains:
+            domain.published = timezone.now() - timedelta(days=183 + 28)
+            domain.renewal_state = Domain.RenewalState.WARNED
+            domain.renewal_changed = timezone.now() - timedelta(days=7)
+            domain.save()
+            domain.rrset_set.update(touched=domain.published)
+
+        delete = Domain.delete
+
+        def fail_second_batch(domain, *args, **kwargs):
+            if m.call_count > 1:
+                raise RuntimeError("deletion failed")
+            return delete(domain, *args, **kwargs)
+
+        command = load_command_class("desecapi", "scavenge-unused")
+        with (
+            mock.patch.object(type(command), "delete_batch_size", 1),
+            mock.patch.object(
+                Domain, "delete", autospec=True, side_effect=fail_second_batch
+            ) as m,
+            self.assertRequests(
+                self.requests_desec_domain_deletion(
+                    min(domains, key=lambda domain: domain.name)
+                ),
+                expect_order=False,
+            ),
+        ):
+            with self.assertRaises(RuntimeError):
+                command.delete_domains(183 + 28)
+
+        # The first batch was committed, the failing one was rolled back
+        self.assertEqual(
+            sorted(
+                Domain.objects.filter(
+                    pk__in=[domain.pk for domain in domains]
+                ).values_list("name", flat=True)
+            ),
+            sorted(domain.name for domain in domains)[1:],
+        )
+
+    def test_renew_domain_warned_7_days_zone_already_deleted(self):
+        domain = self.my_domains[0]
+        domain.published = timezone.now() - timedelta(days=183 + 28)
+        domain.renewal_state = Domain.RenewalState.WARNED
+        domain.renewal_changed = timezone.now() - timedelta(days=7)
+        domain.save()
+        domain.rrset_set.update(touched=domain.published)
+
+        # e.g. after a failed batch whose zones were deleted in pdns, but not in the database
+        zone_deletions, memberships = (
+            self.requests_desec_domain_deletion(domain)[:2],
+            self.requests_desec_domain_deletion(domain)[2:],
+        )
+        with self.assertRequests(
+            *[{**request, "status": 404} for request in zone_deletions],
+            *memberships,
+            expect_order=False,
+        ):
+            load_command_class("desecapi", "scavenge-unused").delete_domains(183 + 28)
+        self.assertFalse(Domain.objects.filter(pk=domain.pk).exists())
+
     def test_renew_domain_inactive_user(self):
         domain = self.my_domains[0]
         for is_active in (False, None):
@@ -1552,3 +1738,77 @@ class RenewNoRRsetTestCase(RenewTestCase):
 
 class RenewDynNoRRsetTestCase(RenewNoRRsetTestCase):
     DYN = True
+
+
+class OutreachEmailTestCase(DesecTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(5):
+            self.create_user()
+        self.create_user(outreach_preference=False)
+        self.create_user(is_active=False)
+        self.users = User.objects.exclude(is_active=False).filter(
+            outreach_preference=True
+        )
+        self.assertGreaterEqual(len(self.users), 5)
+
+    def outreach_email(self, *args, **kwargs):
+        call_command(
+            "outreach-email",
+            *args,
+            contentfile=io.StringIO("Hello, world!"),
+            subject="Test",
+            chunk_size=2,
+            stdout=io.StringIO(),
+            **kwargs,
+        )
+
+    def assertEmailsSent(self, users):
+        self.assertEqual(
+            sorted(email for message in mail.outbox for email in message.to),
+            sorted(user.email for user in users),
+        )
+
+    def test_outreach_email(self):
+        self.outreach_email()
+        self.assertEmailsSent(self.users)
+        for message in mail.outbox:
+            self.assertEqual(message.subject, "[deSEC] Test")
+            self.assertIn("Hello, world!", message.body)
+        checkpoint = OutreachCheckpoint.objects.get()
+        self.assertEqual(checkpoint.queued, len(self.users))
+        self.assertIsNotNone(checkpoint.finished)
+
+        # Repeating the command starts a new run and sends emails again
+        self.outreach_email()
+        self.assertEqual(len(mail.outbox), 2 * len(self.users))
+        self.assertEqual(OutreachCheckpoint.objects.count(), 2)
+
+        # ... but a finished run is not repeated when given explicitly
+        self.outreach_email(run=checkpoint.run)
+        self.assertEqual(len(mail.outbox), 2 * len(self.users))
+
+    def test_outreach_email_resume(self):
+        send_emails = User.send_emails
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("interrupted")
+            return send_emails(*args, **kwargs)
+
+        with mock.patch.object(User, "send_emails", side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                self.outreach_email(run="test")
+        checkpoint = OutreachCheckpoint.objects.get()
+        self.assertEqual(checkpoint.run, "test")
+        self.assertEqual(checkpoint.queued, 2)
+        self.assertIsNone(checkpoint.finished)
+
+        # Resuming sends the remaining emails only
+        self.outreach_email(run="test")
+        self.assertEmailsSent(self.users)
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.queued, len(self.users))
+        self.assertIsNotNone(checkpoint.finished)
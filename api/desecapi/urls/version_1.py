@@ -75,6 +75,7 @@ api_urls = [
         name="rrset@",
     ),
     path("domains/<name>/rrsets/<subname>/<type>/", views.RRsetDetail.as_view()),
+    path("rrsets/", views.BulkRRsetView.as_view(), name="bulk-rrsets"),
     # DynDNS update
     path("dyndns/update", views.DynDNS12UpdateView.as_view(), name="dyndns12update"),
     # Serials
@@ -15,7 +15,7 @@ from .captcha import CaptchaView
 from .donation import DonationList
 from .dyndns import DynDNS12UpdateView
 from .mfa import TOTPViewSet
-from .records import RRsetDetail, RRsetList
+from .records import BulkRRsetView, RRsetDetail, RRsetList
 from .tokens import TokenDomainPolicyViewSet, TokenPoliciesRoot, TokenViewSet
 from .users import (
     AccountChangeEmailView,
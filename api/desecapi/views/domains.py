@@ -1,22 +1,35 @@
+import gzip
+import re
+import secrets
+import time
+from contextlib import closing
 from datetime import timezone, datetime
 
 from django.conf import settings
 from django.core.cache import cache
-from django.db.models import Subquery
+from django.db.models import Max, OuterRef, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.decorators import decorator_from_middleware, method_decorator
+from django.utils.http import quote_etag
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.serializers import ValidationError
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from desecapi import permissions
-from desecapi.models import Domain
+from desecapi.models import Domain, RRset
 from desecapi.pdns import get_serials
 from desecapi.pdns_change_tracker import PDNSChangeTracker
 from desecapi.renderers import PlainTextRenderer
-from desecapi.serializers import DomainSerializer
+from desecapi.serializers import DomainSerializer, ZonefileImportJobSerializer
 
 from .base import IdempotentDestroyMixin
 
@@ -32,6 +45,14 @@ class DomainViewSet(
     serializer_class = DomainSerializer
     lookup_field = "name"
     lookup_value_regex = r"[^/]+"
+    import_job = None
+
+    _rrset_touched = Subquery(
+        RRset.objects.filter(domain=OuterRef("pk"))
+        .values("domain")  # values() is GROUP BY
+        .annotate(max_touched=Max("touched"))
+        .values("max_touched")
+    )
 
     @property
     def permission_classes(self):
@@ -87,13 +108,44 @@ class DomainViewSet(
 
         owns_qname = self.request.query_params.get("owns_qname")
         if owns_qname is not None:
-            qs = qs.filter_qname(owns_qname).order_by("-name_length")[:1]
+            qs = qs.filter_qname(owns_qname).order_by("-name_length")
+
+        # Determine Domain.touched in the same query, instead of once per domain
+        qs = qs.annotate(rrset_touched=self._rrset_touched)
+
+        if owns_qname is not None:
+            qs = qs[:1]
 
         return qs
 
     def get_serializer(self, *args, **kwargs):
         include_keys = self.action in ["create", "retrieve"]
-        return super().get_serializer(*args, include_keys=include_keys, **kwargs)
+        # Clients can ask for the zonefile import to be done in the background (RFC 7240)
+        import_async = self.action == "create" and "respond-async" in [
+            preference.split("=")[0].strip().lower()
+            for preference in self.request.headers.get("Prefer", "").split(",")
+        ]
+        return super().get_serializer(
+            *args, include_keys=include_keys, import_async=import_async, **kwargs
+        )
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if self.import_job is None:
+            return response
+
+        # Domain was created, but zonefile import is pending
+        serializer = ZonefileImportJobSerializer(self.import_job)
+        location = reverse(
+            "v1:domain-import",
+            args=[self.import_job.domain.name, self.import_job.pk],
+            request=request,
+        )
+        return Response(
+            serializer.data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": location},
+        )
 
     def perform_create(self, serializer):
         domain = Domain(name=serializer.validated_data["name"])
@@ -108,6 +160,7 @@ class DomainViewSet(
             )
         with PDNSChangeTracker():
             domain = serializer.save(owner=self.request.user)
+            self.import_job = serializer.import_job
             if self.request.auth.auto_policy:
                 self.request.auth.tokendomainpolicy_set.create(
                     domain=domain, perm_write=True
@@ -130,30 +183,176 @@ class DomainViewSet(
             with PDNSChangeTracker():
                 parent_domain.update_delegation(instance)
 
+    @action(
+        detail=True,
+        url_path=r"imports/(?P<job_id>[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12})",
+        url_name="import",
+    )
+    def imports(self, request, name=None, job_id=None):
+        job = get_object_or_404(self.get_object().import_jobs, pk=job_id)
+        return Response(ZonefileImportJobSerializer(job).data)
+
     @action(detail=True, renderer_classes=[PlainTextRenderer])
     def zonefile(self, request, name=None):
         instance = self.get_object()
         prefix = f"; Zonefile for {instance.name} exported from desec.{settings.DESECSTACK_DOMAIN} at {datetime.now(timezone.utc)}\n".encode()
-        return Response(prefix + instance.zonefile, content_type="text/dns")
+        # Start the export before responding, so that pdns errors are handled as usual
+        chunks = instance.iter_zonefile()
+
+        def content():
+            # StreamingHttpResponse.close() closes this generator, which releases the nslord connection
+            with closing(chunks):
+                yield prefix
+                yield from chunks
+
+        return StreamingHttpResponse(content(), content_type="text/dns")
+
+
+def _accepts_gzip(accept_encoding):
+    """
+    Tells whether the given Accept-Encoding header value allows a gzip-encoded response, taking q-values into account
+    (e.g. "gzip;q=0" refuses it).
+    """
+    qvalues = {}
+    for coding in accept_encoding.split(","):
+        name, *params = [part.strip() for part in coding.split(";")]
+        qvalue = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[name.lower()] = qvalue
+    return qvalues.get("gzip", qvalues.get("*", 0.0)) > 0
+
+
+class _GZipMiddleware(GZipMiddleware):
+    # Django's GZipMiddleware compresses whenever "gzip" occurs in Accept-Encoding, even with q=0
+    def process_response(self, request, response):
+        if _accepts_gzip(request.headers.get("Accept-Encoding", "")):
+            return super().process_response(request, response)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
 
 
+@method_decorator(decorator_from_middleware(_GZipMiddleware), name="dispatch")
 class SerialListView(APIView):
+    """
+    Lists the serials of all zones on nsmaster. With `?since=<token>`, only zones whose serial changed since the
+    state identified by the token are returned (deleted zones map to `null`), together with a token for the next call.
+    An empty or unknown (e.g. expired) token yields all serials instead, indicated by `full` being true.
+
+    Responses are served from a snapshot which is published periodically by the `refresh-serials` command. If there
+    is no current snapshot, one request publishes it from nsmaster, while concurrent ones get a 503.
+    """
+
     permission_classes = (permissions.IsVPNClient,)
     throttle_classes = []  # don't break secondaries when they ask too often (our cached responses are cheap)
 
+    key = "desecapi.views.serials"
+    changelog_timeout = 3600  # how long a token can be used to retrieve changes
+    # refresh-serials runs every minute; older snapshots are stale and are not served
+    snapshot_timeout = 300
+    # how often to wait for a concurrent refresh to publish its snapshot, before starting a new changelog
+    refresh_attempts = 20
+
+    @classmethod
+    def refresh(cls):
+        """
+        Fetches the current serials from nsmaster and publishes them as a new snapshot version, including a
+        precompressed rendering of the full list. Records the changes since the previous version in the changelog.
+        """
+        serials = get_serials()
+        body = JSONRenderer().render(serials)
+        for attempt in range(cls.refresh_attempts + 1):
+            state = cache.get(cls.key)
+            if state is None or attempt == cls.refresh_attempts:
+                # Start a new changelog; clients holding a token of the previous one get all serials
+                state = {"epoch": secrets.token_hex(4), "version": 0, "serials": {}}
+            delta = {
+                name: serial
+                for name, serial in serials.items()
+                if state["serials"].get(name) != serial
+            }
+            delta.update(
+                {name: None for name in state["serials"].keys() - serials.keys()}
+            )
+            epoch, version = state["epoch"], state["version"] + 1
+            # Claim the next version. If a concurrent refresh claimed it first, wait for its snapshot and build on
+            # it, so that no version's delta gets overwritten.
+            if cache.add(
+                f"{cls.key}.delta.{epoch}.{version}",
+                delta,
+                timeout=cls.changelog_timeout,
+            ):
+                break
+            time.sleep(0.1)
+        state = {
+            "epoch": epoch,
+            "version": version,
+            "serials": serials,
+            "body": body,
+            "body_gzip": gzip.compress(body, mtime=0),
+        }
+        cache.set(cls.key, state, timeout=cls.snapshot_timeout)
+        return state
+
+    @classmethod
+    def _get_delta(cls, state, since):
+        epoch, _, version = since.partition(".")
+        if (
+            epoch != state["epoch"]
+            or not version.isdigit()
+            or int(version) > state["version"]
+        ):
+            return None
+        versions = range(int(version) + 1, state["version"] + 1)
+        keys = [f"{cls.key}.delta.{epoch}.{v}" for v in versions]
+        deltas = cache.get_many(keys)
+        if len(deltas) != len(keys):
+            return None
+        serials = {}
+        for key in keys:
+            serials.update(deltas[key])
+        return serials
+
     def get(self, request, *args, **kwargs):
-        key = "desecapi.views.serials"
-        # Determine if the last update is older than 60s and nobody is working on it
-        # If so, start working on it; other workers will keep using the old list
-        our_update = cache.add(f"{key}.sentinel", True, timeout=60)
-        if our_update:
-            serials = get_serials()
-            cache.set(key, serials, timeout=300)  # long expiration, overwritten 1/min
-        else:
-            serials = cache.get(key)
-            if serials is None:
+        state = cache.get(self.key)
+        if state is None:
+            # Determine if nobody is working on it. If so, start working on it; other workers fail until it's done
+            if not cache.add(f"{self.key}.sentinel", True, timeout=60):
                 return Response(
                     data={"detail": "Serial cache not ready"},
-                    status=status.HTTP_409_CONFLICT,
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": "5"},
                 )
-        return Response(serials)
+            state = self.refresh()
+
+        token = f"{state['epoch']}.{state['version']}"
+        since = request.query_params.get("since")
+        if since is not None and not re.fullmatch(r"[0-9a-f]+\.[0-9]+", since):
+            since = ""  # unknown token, yields all serials
+        etag = quote_etag(token if since is None else f"{since}-{token}")
+        if (
+            response := get_conditional_response(request._request, etag=etag)
+        ) is not None:
+            return response
+
+        if since is None:
+            response = HttpResponse(content_type="application/json")
+            patch_vary_headers(response, ("Accept-Encoding",))
+            if _accepts_gzip(request.headers.get("Accept-Encoding", "")):
+                response.content = state["body_gzip"]
+                response["Content-Encoding"] = "gzip"
+            else:
+                response.content = state["body"]
+        elif (delta := self._get_delta(state, since)) is not None:
+            response = Response({"token": token, "full": False, "serials": delta})
+        else:
+            response = Response(
+                {"token": token, "full": True, "serials": state["serials"]}
+            )
+        response["ETag"] = etag
+        return response
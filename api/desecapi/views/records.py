@@ -1,10 +1,15 @@
-from django.http import Http404
+from functools import cached_property
+
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import generics
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from desecapi import models, permissions
 from desecapi.pdns_change_tracker import PDNSChangeTracker
+from desecapi.renderers import NDJSONRenderer
 from desecapi.serializers import RRsetSerializer
 
 from .base import IdempotentDestroyMixin
@@ -25,7 +30,7 @@ class EmptyPayloadMixin:
 
 
 class DomainViewMixin:
-    @property
+    @cached_property
     def domain(self):
         try:
             # noinspection PyUnresolvedReferences
@@ -58,6 +63,11 @@ class RRsetView(DomainViewMixin):
         return None if self.request.method in SAFE_METHODS else self.kwargs["name"]
 
     def get_queryset(self):
+        # RRsets from the domain's related manager reference self.domain (no extra query for RRset.domain).
+        # For reading, fetch all records in one query; writes need fresh records.
+        # noinspection PyUnresolvedReferences
+        if self.request.method in SAFE_METHODS:
+            return self.domain.rrset_set.prefetch_related("records")
         return self.domain.rrset_set
 
     def get_serializer_context(self):
@@ -110,6 +120,9 @@ class RRsetDetail(
 class RRsetList(
     RRsetView, EmptyPayloadMixin, generics.ListCreateAPIView, generics.UpdateAPIView
 ):
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+    stream_chunk_size = 1000
+
     def get_queryset(self):
         rrsets = super().get_queryset()
 
@@ -149,6 +162,104 @@ class RRsetList(
 
         return super().get_serializer(*args, **kwargs)
 
+    def list(self, request, *args, **kwargs):
+        if isinstance(request.accepted_renderer, NDJSONRenderer):
+            return self.stream(request.accepted_renderer)
+        return super().list(request, *args, **kwargs)
+
+    def stream(self, renderer):
+        """
+        Streams all matching RRsets as newline-delimited JSON, without pagination. RRsets
+        and their (prefetched) records are fetched in chunks, so memory usage does not grow
+        with the size of the zone.
+        """
+        # same order as the paginated listing
+        queryset = self.filter_queryset(self.get_queryset()).order_by("-created", "pk")
+        serializer = self.get_serializer()
+
+        def lines():
+            for rrset in queryset.iterator(chunk_size=self.stream_chunk_size):
+                data = serializer.to_representation(rrset)
+                if data is not None:  # skip empty RRsets (they don't exist)
+                    yield renderer.render_line(data)
+
+        return StreamingHttpResponse(lines(), content_type=renderer.media_type)
+
     def perform_create(self, serializer):
         with PDNSChangeTracker():
             super().perform_create(serializer)
+
+
+class BulkRRsetView(EmptyPayloadMixin, generics.GenericAPIView):
+    """
+    Modifies RRsets of several domains at once. The request is a list of RRsets as for the bulk PATCH on a domain's
+    rrsets/ endpoint, with each RRset carrying the name of its domain in the `domain` field. All RRsets are validated
+    before any change is made, and changes are published in one PDNSChangeTracker run (one update per zone).
+    """
+
+    serializer_class = RRsetSerializer
+    permission_classes = (
+        IsAuthenticated,
+        permissions.IsAPIToken | permissions.MFARequiredIfEnabled,
+    )
+    throttle_scope = "dns_api_multi_domain_expensive"
+
+    def patch(self, request, *args, **kwargs):
+        data = request.data
+        if not isinstance(data, list):
+            raise ValidationError(
+                {
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        f"Expected a list of items but got {type(data).__name__}."
+                    ]
+                },
+                code="not_a_list",
+            )
+
+        names = {
+            item.get("domain")
+            for item in data
+            if isinstance(item, dict) and isinstance(item.get("domain"), str)
+        }
+        domains = {
+            domain.name: domain
+            for domain in self.request.user.domains.filter(name__in=names)
+        }
+
+        # Group RRsets by domain, remembering their positions in the request
+        errors = [{} for _ in data]
+        indices = {}
+        for idx, item in enumerate(data):
+            if not isinstance(item, dict):
+                errors[idx] = {
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        f"Expected a dictionary, but got {type(item).__name__}."
+                    ]
+                }
+            elif item.get("domain") not in domains:
+                errors[idx] = {"domain": ["This domain does not exist."]}
+            else:
+                indices.setdefault(item["domain"], []).append(idx)
+
+        serializers = []
+        for name, domain_indices in indices.items():
+            serializer = self.get_serializer_class()(
+                instance=domains[name].rrset_set.all(),
+                data=[data[idx] for idx in domain_indices],
+                many=True,
+                partial=True,
+                context={**self.get_serializer_context(), "domain": domains[name]},
+            )
+            if not serializer.is_valid():
+                for idx, error in zip(domain_indices, serializer.errors):
+                    errors[idx] = error
+            serializers.append(serializer)
+
+        if any(errors):
+            raise ValidationError(errors)
+
+        with PDNSChangeTracker():
+            for serializer in serializers:
+                serializer.save()
+
+        return Response([item for s in serializers for item in s.data if item])
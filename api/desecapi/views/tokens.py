@@ -35,7 +35,7 @@ class TokenViewSet(IdempotentDestroyMixin, viewsets.ModelViewSet):
     def get_queryset(self):
         return Token.objects.filter(
             Q(owner=self.request.user) | Q(user_override=self.request.user)
-        ).all()
+        ).select_related("owner", "user_override")
 
     def get_serializer(self, *args, **kwargs):
         # When creating a new token, return the plaintext representation
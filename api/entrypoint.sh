@@ -18,7 +18,7 @@ chmod 1777 /var/local/django_metrics
 python manage.py migrate || exit 1
 
 # Prepare catalog zone
-python manage.py align-catalog-zone
+python manage.py align-catalog-zone --incremental
 
 echo Starting API server ...
 exec uwsgi --ini uwsgi.ini